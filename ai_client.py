@@ -1,115 +1,427 @@
-import requests
 import json
-from threading import Lock
+import queue
+import asyncio
+from threading import Thread
+from sentence_segmenter import SentenceSegmenter
+from http_transport import get_transport
+from conversation_context import ConversationContext
+from response_cache import make_context_key
+from latency_trace import TurnTrace
+
+
+class OllamaError(Exception):
+    """Ollama返回了非200状态码"""
+
+    def __init__(self, status_code):
+        super().__init__(f"API请求失败，状态码: {status_code}")
+        self.status_code = status_code
+
+
+class AsyncAIClient:
+    def __init__(self, ollama_url="http://localhost:11434/api/chat", model_name="Elysia",
+                 connect_timeout=3.05, read_timeout=120, max_connections=4):
+        """基于asyncio的Ollama客户端，回复以异步迭代器逐个产出，任务取消时关闭HTTP流使Ollama停止生成"""
+        self.ollama_url = ollama_url
+        self.model_name = model_name
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self._session = None
+
+    async def _get_session(self):
+        import aiohttp
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit_per_host=self.max_connections),
+                timeout=aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout,
+                                              sock_read=self.read_timeout)
+            )
+        return self._session
+
+    async def stream_chat(self, messages, **request_options):
+        """发送对话请求，逐个产出回复内容片段"""
+        session = await self._get_session()
+        request_data = {
+            "model": self.model_name,
+            "messages": messages,
+            "stream": True
+        }
+        request_data.update(request_options)
+
+        response = await session.post(self.ollama_url, json=request_data)
+        finished = False
+        try:
+            if response.status != 200:
+                raise OllamaError(response.status)
+            async for line in response.content:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    json_data = json.loads(line.decode('utf-8'))
+                except json.JSONDecodeError:
+                    continue
+                if 'message' in json_data and 'content' in json_data['message']:
+                    yield json_data['message']['content']
+                if json_data.get('done', False):
+                    finished = True
+                    break
+        finally:
+            if finished:
+                response.release()
+            else:
+                # 中途取消或出错：直接断开连接，Ollama检测到断开后停止生成
+                response.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+class EventLoopThread:
+    """在后台线程中运行的事件循环，供同步代码提交协程"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def submit(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
 
 
 class AIClient:
-    def __init__(self, ollama_url="http://localhost:11434/api/chat", model_name="Elysia"):
-        """初始化AI客户端"""
+    def __init__(self, ollama_url="http://localhost:11434/api/chat", model_name="Elysia", transport=None,
+                 context_tokens=2048, system_prompt=None, summary_model=None, keep_alive="30m", options=None,
+                 response_cache=None, cache_context_messages=2):
+        """初始化AI客户端，transport默认使用共享的HTTP连接池
+
+        对话请求由AsyncAIClient在后台事件循环中完成，本类提供回调形式的同步接口；
+        context_tokens为对话历史的token预算，超出时较早的轮次被折叠为摘要（由summary_model生成）；
+        keep_alive和options（如num_ctx、num_predict）随每次请求发送。num_ctx不同会使Ollama重新加载模型，
+        因此预加载、对话和摘要请求使用同一组options；
+        response_cache为可选的ResponseCache，cache_context_messages为计入缓存键的最近消息数，
+        默认包含上一轮问答，避免把依赖上文的回答（如“那明天呢”）用到别的对话里
+        """
         self.ollama_url = ollama_url
         self.model_name = model_name
-        self.conversation_history = []
-        self.history_lock = Lock()
+        self.transport = transport or get_transport()
+        # 由聊天接口地址推出服务根地址，用于其他API
+        self.base_url = ollama_url.split("/api/")[0]
+        self.summary_model = summary_model or model_name
+        self.keep_alive = keep_alive
+        self.options = dict(options or {})
+        self.response_cache = response_cache
+        self.cache_context_messages = cache_context_messages
+        self.context = ConversationContext(context_tokens, system_prompt=system_prompt,
+                                           summarizer=self.summarize)
+        # 对话请求与同步请求使用同一组连接数和超时配置
+        self.async_client = AsyncAIClient(ollama_url, model_name,
+                                          connect_timeout=self.transport.connect_timeout,
+                                          read_timeout=self.transport.read_timeout,
+                                          max_connections=self.transport.pool_maxsize)
+        self._loop_thread = EventLoopThread()
+        self._current_request = None
+        # 推测预填：用户说话期间用已确认的部分文本预热Ollama的提示缓存
+        self.speculative_min_chars = 4  # 已确认文本至少增长这么多字才重新预填
+        self.speculative_wait = 1.0  # 正式请求发出前最多等待被沿用的预填完成的秒数
+        self._speculative_request = None
+        self._speculative_text = ""
+        self._resolved_prefill = None  # 被最终文本沿用、仍可能在进行的预填请求
+
+    def stream_tokens(self, messages, **request_options):
+        """在后台事件循环中运行异步请求，以同步生成器逐个返回内容片段；被cancel()时抛出CancelledError"""
+        tokens = queue.Queue()
+
+        async def pump():
+            try:
+                async for content in self.async_client.stream_chat(messages, **request_options):
+                    tokens.put(("token", content))
+                tokens.put(("done", None))
+            except Exception as e:
+                tokens.put(("error", e))
+
+        future = self._loop_thread.submit(pump())
+        # 任务被取消时（包括尚未开始运行就被取消）通知消费方
+        future.add_done_callback(lambda f: f.cancelled() and tokens.put(("cancelled", None)))
+        self._current_request = future
+        try:
+            while True:
+                kind, value = tokens.get()
+                if kind == "token":
+                    yield value
+                elif kind == "done":
+                    return
+                elif kind == "cancelled":
+                    raise asyncio.CancelledError()
+                else:
+                    raise value
+        finally:
+            # 调用方提前退出时也要停止后台请求
+            future.cancel()
+            if self._current_request is future:
+                self._current_request = None
+
+    def cancel(self):
+        """取消正在进行的生成，关闭HTTP流使Ollama停止计算"""
+        request = self._current_request
+        if request is not None and not request.done():
+            request.cancel()
+            return True
+        return False
+
+    def prefill(self, partial_text):
+        """用户仍在说话时，以历史加已确认的部分文本发出只生成1个token的请求，让Ollama提前计算提示；
+        之后正式请求的前缀与之相同，Ollama复用已缓存的部分，只需计算新增的尾部"""
+        partial_text = (partial_text or "").strip()
+        if len(partial_text) - len(self._speculative_text) < self.speculative_min_chars:
+            return
+        if self._current_request is not None and not self._current_request.done():
+            # 正在生成回复时不抢占模型
+            return
+
+        self.cancel_prefill()
+        messages = self.context.build_messages() + [{"role": "user", "content": partial_text}]
+
+        async def warm():
+            async for _ in self.async_client.stream_chat(messages, **self.request_options(num_predict=1)):
+                pass
+
+        self._speculative_text = partial_text
+        self._speculative_request = self._loop_thread.submit(warm())
+
+    def cancel_prefill(self):
+        """放弃推测预填（开始新的录音或识别结果与预填不符时）"""
+        for request in (self._speculative_request, self._resolved_prefill):
+            if request is not None and not request.done():
+                request.cancel()
+        self._speculative_request = None
+        self._resolved_prefill = None
+        self._speculative_text = ""
+
+    def resolve_prefill(self, final_text):
+        """识别完成时调用：最终文本延续了预填的前缀则让预填请求继续完成，否则取消，由正式请求代替"""
+        speculative_text = self._speculative_text
+        if speculative_text and (final_text or "").strip().startswith(speculative_text):
+            self._resolved_prefill = self._speculative_request
+            self._speculative_request = None
+            self._speculative_text = ""
+            return True
+        self.cancel_prefill()
+        return False
 
-    def get_ai_response_stream(self, user_input, response_callback=None, enable_tts=True, tts_service=None):
-        """流式获取AI回复"""
+    def _wait_prefill(self):
+        """等待被沿用的预填完成后再发正式请求：预填占用的缓存槽位在完成前不会被复用，
+        并行处理多个请求时正式请求会落到别的槽位，重新计算整个提示并与预填争抢算力。
+        预填只生成1个token，通常很快结束；超时则直接发出正式请求"""
+        request, self._resolved_prefill = self._resolved_prefill, None
+        if request is None or request.done():
+            return
+        try:
+            request.result(timeout=self.speculative_wait)
+        except Exception:
+            # 超时、取消或预填失败都不影响正式请求
+            pass
+
+    def get_ai_response_stream(self, user_input, response_callback=None, enable_tts=True, tts_service=None,
+                               trace=None):
+        """流式获取AI回复；trace为本轮的延迟追踪，记录请求发出、首个与最后一个token的时间"""
+        trace = trace or TurnTrace()
+        trace.hold()
+        try:
+            return self._stream_response(user_input, response_callback, enable_tts, tts_service, trace)
+        finally:
+            trace.release()
+
+    def _stream_response(self, user_input, response_callback, enable_tts, tts_service, trace):
         if not user_input or len(user_input.strip()) == 0:
             error_msg = "我没有听清楚您说的话，请再说一遍。"
             if response_callback:
                 response_callback(error_msg, done=True)
             if enable_tts and tts_service:
-                from threading import Thread
-                Thread(target=lambda: tts_service.text_to_speech(error_msg), daemon=True).start()
+                speech = tts_service.create_pipeline(trace)
+                speech.speak(error_msg)
+                speech.close()
             return error_msg
 
+        # 边生成边分句播报
+        speech = None
+        segmenter = None
+        if enable_tts and tts_service:
+            speech = tts_service.create_pipeline(trace)
+            segmenter = SentenceSegmenter()
+
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = self._response_cache_key()
+            cached_response = self.response_cache.get(user_input, cache_key)
+            if cached_response is not None:
+                trace.set(response_cache_hit=True)
+                return self._replay_cached_response(user_input, cached_response, response_callback,
+                                                    speech, segmenter)
+
         try:
             # 添加用户消息到历史
-            with self.history_lock:
-                self.conversation_history.append({"role": "user", "content": user_input})
-
-            request_data = {
-                "model": self.model_name,
-                "messages": self.conversation_history,
-                "stream": True
-            }
+            self.context.add("user", user_input)
+            messages = self.context.build_messages()
 
             print(" AI正在思考: ", end="", flush=True)
 
-            full_response = ""
+            parts = []
+            cancelled = False
 
-            response = requests.post(
-                self.ollama_url,
-                json=request_data,
-                stream=True,
-                timeout=120  # 延长超时时间
-            )
+            self._wait_prefill()
+            trace.mark("llm_request")
+            try:
+                for content in self.stream_tokens(messages, **self.request_options()):
+                    if not parts:
+                        trace.mark("first_token")
+                    parts.append(content)
+                    print(content, end="", flush=True)
+                    if speech:
+                        for sentence in segmenter.feed(content):
+                            speech.speak(sentence)
+                    if response_callback:
+                        response_callback(content, done=False)
+            except asyncio.CancelledError:
+                cancelled = True
+                print("\n 生成已取消", end="")
+            trace.mark("last_token")
+            trace.set(token_count=len(parts), llm_cancelled=cancelled)
+            full_response = "".join(parts)
 
-            if response.status_code == 200:
-                for line in response.iter_lines():
-                    if line:
-                        try:
-                            json_data = json.loads(line.decode('utf-8'))
-                            if 'message' in json_data and 'content' in json_data['message']:
-                                content = json_data['message']['content']
-                                full_response += content
-                                print(content, end="", flush=True)
-                                if response_callback:
-                                    response_callback(content, done=False)
-                            if json_data.get('done', False):
-                                break
-                        except json.JSONDecodeError:
-                            continue
-
-                # 添加AI回复到历史
-                if full_response:
-                    with self.history_lock:
-                        self.conversation_history.append({"role": "assistant", "content": full_response})
-                        # 限制历史长度
-                        if len(self.conversation_history) > 8:
-                            self.conversation_history = self.conversation_history[-8:]
-
-                print()  # 换行
-
-                if response_callback:
-                    response_callback(full_response, done=True)
-
-                # 播放语音回复
-                if enable_tts and full_response and tts_service:
-                    print(" 正在生成语音回复...")
-                    from threading import Thread
-                    Thread(target=lambda: tts_service.text_to_speech(full_response), daemon=True).start()
-
-                return full_response
-            else:
-                error_msg = f"API请求失败，状态码: {response.status_code}"
-                print(f"\n{error_msg}")
-                if response_callback:
-                    response_callback(error_msg, done=True)
-                if enable_tts and tts_service:
-                    from threading import Thread
-                    Thread(target=lambda: tts_service.text_to_speech("抱歉，AI服务暂时不可用。"), daemon=True).start()
-                return error_msg
+            # 添加AI回复到历史
+            if full_response:
+                self.context.add("assistant", full_response)
+                if cache_key is not None and not cancelled:
+                    self.response_cache.put(user_input, full_response, cache_key)
+            elif cancelled:
+                # 没有任何回复的问题不留在历史中
+                self.context.drop_unanswered()
+
+            print()  # 换行
+
+            if response_callback:
+                response_callback(full_response, done=True)
+
+            # 播报剩余的最后一句
+            if speech:
+                if not cancelled:
+                    for sentence in segmenter.flush():
+                        speech.speak(sentence)
+                speech.close()
+
+            return full_response
+
+        except OllamaError as e:
+            error_msg = str(e)
+            print(f"\n{error_msg}")
+            if response_callback:
+                response_callback(error_msg, done=True)
+            if speech:
+                speech.speak("抱歉，AI服务暂时不可用。")
+                speech.close()
+            return error_msg
 
         except Exception as e:
             error_msg = f"AI回复错误: {e}"
             print(f"\n{error_msg}")
             if response_callback:
                 response_callback(error_msg, done=True)
-            if enable_tts and tts_service:
-                from threading import Thread
-                Thread(target=lambda: tts_service.text_to_speech("处理请求时出现错误。"), daemon=True).start()
+            if speech:
+                speech.speak("处理请求时出现错误。")
+                speech.close()
             return error_msg
 
+    def _response_cache_key(self):
+        """影响回复内容的上下文：模型、系统提示、生成参数以及最近几条对话"""
+        return make_context_key(self.model_name, self.context.system_prompt, self.options,
+                                self.context.recent(self.cache_context_messages))
+
+    def _replay_cached_response(self, user_input, response, response_callback, speech, segmenter):
+        """缓存命中：按与正常生成相同的路径交给回调和TTS"""
+        print(f" AI回复（缓存）: {response}")
+        self.context.add("user", user_input)
+        self.context.add("assistant", response)
+
+        if speech:
+            for sentence in segmenter.feed(response) + segmenter.flush():
+                speech.speak(sentence)
+        if response_callback:
+            response_callback(response, done=False)
+            response_callback(response, done=True)
+        if speech:
+            speech.close()
+        return response
+
+    def request_options(self, **overrides):
+        """每次请求附带的keep_alive与options"""
+        request_options = {"options": dict(self.options, **overrides)}
+        if self.keep_alive is not None:
+            request_options["keep_alive"] = self.keep_alive
+        return request_options
+
+    def summarize(self, previous_summary, messages):
+        """把被淘汰的对话折叠进摘要（在后台线程中调用）"""
+        transcript = "\n".join(
+            f"{'用户' if message['role'] == 'user' else '助手'}: {message['content']}" for message in messages
+        )
+        prompt = (
+            "请把下面的对话内容合并进已有摘要，用不超过150字的中文客观概括用户的信息、"
+            "提到的事情和约定，只输出摘要本身。\n"
+            f"已有摘要：{previous_summary or '无'}\n对话：\n{transcript}"
+        )
+        response = self.transport.post(
+            self.ollama_url,
+            json={
+                "model": self.summary_model,
+                "messages": [{"role": "user", "content": prompt}],
+                "stream": False,
+                **self.request_options(num_predict=256)
+            },
+            read_timeout=120
+        )
+        if response.status_code != 200:
+            raise OllamaError(response.status_code)
+        return response.json()["message"]["content"].strip()
+
+    def preload(self):
+        """在后台发送空对话请求，让Ollama提前把模型加载到内存（或显存）中"""
+
+        def run():
+            try:
+                response = self.transport.post(
+                    self.ollama_url,
+                    json={"model": self.model_name, "messages": [], "stream": False,
+                          **self.request_options()},
+                    read_timeout=300
+                )
+                if response.status_code == 200:
+                    print(f" 模型 {self.model_name} 已加载")
+                else:
+                    print(f" 模型预加载失败，状态码: {response.status_code}")
+            except Exception as e:
+                print(f" 模型预加载失败: {e}")
+
+        Thread(target=run, daemon=True).start()
+
+    def has_model(self, models):
+        """检查/api/tags返回的模型列表中是否有当前模型（未写标签时按latest匹配）"""
+        name = self.model_name if ":" in self.model_name else f"{self.model_name}:latest"
+        return any(model.get("name") in (self.model_name, name) for model in models)
+
     def check_connection(self):
-        """检查Ollama连接"""
+        """检查Ollama连接以及模型是否存在"""
         try:
-            test_response = requests.get("http://localhost:11434/api/tags", timeout=10)
-            if test_response.status_code == 200:
-                print(" Ollama服务连接正常")
-                return True
-            else:
+            test_response = self.transport.request_with_retry("GET", f"{self.base_url}/api/tags", read_timeout=10)
+            if test_response.status_code != 200:
                 print(" Ollama服务异常")
                 return False
+            print(" Ollama服务连接正常")
+            if not self.has_model(test_response.json().get("models", [])):
+                print(f" Ollama中没有模型 {self.model_name}，请先创建或拉取该模型")
+                return False
+            return True
         except Exception as e:
             print(f" 无法连接到Ollama: {e}")
             return False
\ No newline at end of file
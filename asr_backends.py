@@ -0,0 +1,85 @@
+"""
+语音识别后端模块
+统一不同Whisper推理引擎的接口，识别结果格式一致：
+{"text": str, "language": str, "segments": [{"start": float, "end": float, "text": str}]}
+"""
+import warnings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ASRBackend:
+    """语音识别后端接口"""
+    name = "base"
+
+    def transcribe(self, audio, initial_prompt=None, language=None):
+        """识别16kHz float32单声道音频数组"""
+        raise NotImplementedError
+
+
+class WhisperBackend(ASRBackend):
+    """openai-whisper（PyTorch）后端"""
+    name = "whisper"
+
+    def __init__(self, model_size="base", device=None):
+        import whisper
+
+        # 抑制Whisper的警告
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            self.model = whisper.load_model(model_size, device=device)
+        # CPU不支持fp16，显式关闭以免每次识别都回退并告警
+        self.fp16 = self.model.device.type != "cpu"
+
+    def transcribe(self, audio, initial_prompt=None, language=None):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            result = self.model.transcribe(audio, initial_prompt=initial_prompt, language=language,
+                                           fp16=self.fp16)
+        return {
+            "text": result["text"],
+            "language": result.get("language"),
+            "segments": [
+                {"start": segment["start"], "end": segment["end"], "text": segment["text"]}
+                for segment in result.get("segments", [])
+            ]
+        }
+
+
+class FasterWhisperBackend(ASRBackend):
+    """faster-whisper（CTranslate2）后端，CPU上可使用int8量化推理"""
+    name = "faster-whisper"
+
+    def __init__(self, model_size="base", device="cpu", compute_type="int8", cpu_threads=0):
+        from faster_whisper import WhisperModel
+
+        self.model = WhisperModel(model_size, device=device or "cpu", compute_type=compute_type,
+                                  cpu_threads=cpu_threads)
+
+    def transcribe(self, audio, initial_prompt=None, language=None):
+        segments, info = self.model.transcribe(audio, initial_prompt=initial_prompt, language=language,
+                                               beam_size=5)
+        # segments是惰性生成器，遍历时才真正解码
+        segments = [
+            {"start": segment.start, "end": segment.end, "text": segment.text}
+            for segment in segments
+        ]
+        return {
+            "text": "".join(segment["text"] for segment in segments),
+            "language": info.language,
+            "segments": segments
+        }
+
+
+def create_backend(name="whisper", model_size="base", device=None, compute_type="int8"):
+    """按名称创建识别后端；faster-whisper未安装时回退到openai-whisper"""
+    if name == FasterWhisperBackend.name:
+        try:
+            return FasterWhisperBackend(model_size, device=device or "cpu", compute_type=compute_type)
+        except ImportError:
+            logger.warning("未安装faster-whisper，回退到openai-whisper后端")
+            return WhisperBackend(model_size, device=device)
+    if name == WhisperBackend.name:
+        return WhisperBackend(model_size, device=device)
+    raise ValueError(f"不支持的识别后端: {name}")
@@ -0,0 +1,90 @@
+"""
+音频缓冲模块
+提供预分配、可增长的int16采样缓冲区，供录音回调直接写入
+"""
+import numpy as np
+from threading import Lock
+
+
+class AudioBuffer:
+    def __init__(self, sample_rate=16000, initial_seconds=30):
+        """初始化缓冲区，预分配initial_seconds秒的空间，不足时按倍数扩容"""
+        self.sample_rate = sample_rate
+        self._data = np.zeros(int(sample_rate * initial_seconds), dtype=np.int16)
+        self._length = 0
+        self._lock = Lock()
+
+    def __len__(self):
+        return self._length
+
+    @property
+    def duration(self):
+        """已写入音频的时长（秒）"""
+        return self._length / self.sample_rate
+
+    def clear(self):
+        """清空缓冲区（保留已分配的空间）"""
+        with self._lock:
+            self._length = 0
+
+    def append(self, samples):
+        """追加一块采样数据（录音回调中调用）"""
+        samples = np.asarray(samples, dtype=np.int16).reshape(-1)
+        with self._lock:
+            end = self._length + len(samples)
+            if end > len(self._data):
+                capacity = max(end, len(self._data) * 2)
+                grown = np.zeros(capacity, dtype=np.int16)
+                grown[:self._length] = self._data[:self._length]
+                self._data = grown
+            self._data[self._length:end] = samples
+            self._length = end
+
+    def get_float32(self, start=0, end=None):
+        """获取[start, end)区间归一化到[-1, 1]的float32采样，可直接送入Whisper"""
+        with self._lock:
+            end = self._length if end is None else min(end, self._length)
+            samples = self._data[start:end].astype(np.float32)
+        samples *= 1.0 / 32768.0
+        return samples
+
+
+class RingBuffer:
+    def __init__(self, capacity):
+        """固定容量的int16环形缓冲区，只保留最近capacity个采样（用于预录）"""
+        self._data = np.zeros(capacity, dtype=np.int16)
+        self._write_pos = 0
+        self._length = 0
+
+    def __len__(self):
+        return self._length
+
+    def clear(self):
+        self._write_pos = 0
+        self._length = 0
+
+    def write(self, samples):
+        """写入采样，超出容量时覆盖最早的数据"""
+        samples = np.asarray(samples, dtype=np.int16).reshape(-1)
+        capacity = len(self._data)
+        if len(samples) >= capacity:
+            self._data[:] = samples[-capacity:]
+            self._write_pos = 0
+            self._length = capacity
+            return
+
+        end = self._write_pos + len(samples)
+        if end <= capacity:
+            self._data[self._write_pos:end] = samples
+        else:
+            split = capacity - self._write_pos
+            self._data[self._write_pos:] = samples[:split]
+            self._data[:end - capacity] = samples[split:]
+        self._write_pos = end % capacity
+        self._length = min(capacity, self._length + len(samples))
+
+    def read_all(self):
+        """按时间顺序返回缓冲区中全部采样的副本"""
+        if self._length < len(self._data):
+            return self._data[:self._length].copy()
+        return np.concatenate([self._data[self._write_pos:], self._data[:self._write_pos]])
@@ -0,0 +1,240 @@
+"""
+音频播放模块
+边下载边播放：解析WAV头后把PCM数据经抖动缓冲送入输出流，播放结束通过事件通知，
+不写临时文件也不轮询；缓存命中的完整音频作为单个数据块走同一路径
+"""
+import io
+import wave
+import queue
+import struct
+import numpy as np
+import sounddevice as sd
+from threading import Event, Lock
+
+SAMPLE_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+
+def decode_wav(audio_content):
+    """解析内存中的WAV数据，返回(采样数组[帧数, 声道数], 采样率)"""
+    with wave.open(io.BytesIO(audio_content), "rb") as wf:
+        sample_width = wf.getsampwidth()
+        if sample_width not in SAMPLE_DTYPES:
+            raise ValueError(f"不支持的采样位宽: {sample_width * 8}位")
+        channels = wf.getnchannels()
+        sample_rate = wf.getframerate()
+        frames = wf.readframes(wf.getnframes())
+    samples = np.frombuffer(frames, dtype=SAMPLE_DTYPES[sample_width]).reshape(-1, channels)
+    return samples, sample_rate
+
+
+class WavFormat:
+    def __init__(self, channels, sample_rate, sample_width):
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+
+    @property
+    def frame_size(self):
+        """每帧字节数"""
+        return self.channels * self.sample_width
+
+    @property
+    def bytes_per_second(self):
+        return self.frame_size * self.sample_rate
+
+
+class WavStreamParser:
+    """增量解析WAV数据：先读出格式信息，之后只返回按帧对齐的PCM数据"""
+
+    def __init__(self):
+        self.format = None
+        self._header = bytearray()
+        self._in_data = False
+        self._data_remaining = None  # 流式WAV的data长度常为0或0xFFFFFFFF，此时不限制
+        self._remainder = b""
+
+    def feed(self, data):
+        """送入一段字节，返回其中可播放的PCM数据"""
+        if self._in_data:
+            return self._align(data)
+
+        self._header += data
+        if len(self._header) < 12:
+            return b""
+        if self._header[:4] != b"RIFF" or self._header[8:12] != b"WAVE":
+            raise ValueError("不是有效的WAV数据")
+
+        position = 12
+        while position + 8 <= len(self._header):
+            chunk_id = bytes(self._header[position:position + 4])
+            size = struct.unpack("<I", self._header[position + 4:position + 8])[0]
+            if chunk_id == b"data":
+                if self.format is None:
+                    raise ValueError("WAV数据缺少fmt块")
+                self._in_data = True
+                if 0 < size < 0xFFFFFFFF:
+                    self._data_remaining = size
+                pcm = bytes(self._header[position + 8:])
+                self._header = bytearray()
+                return self._align(pcm)
+            if position + 8 + size > len(self._header):
+                return b""  # 块还不完整，等待更多数据
+            if chunk_id == b"fmt ":
+                _, channels, sample_rate, _, _, bits = struct.unpack(
+                    "<HHIIHH", self._header[position + 8:position + 24])
+                if bits // 8 not in SAMPLE_DTYPES:
+                    raise ValueError(f"不支持的采样位宽: {bits}位")
+                self.format = WavFormat(channels, sample_rate, bits // 8)
+            position += 8 + size + (size & 1)
+        return b""
+
+    def _align(self, data):
+        if self._data_remaining is not None:
+            data = data[:self._data_remaining]
+            self._data_remaining -= len(data)
+        data = self._remainder + data
+        usable = len(data) - len(data) % self.format.frame_size
+        self._remainder = data[usable:]
+        return data[:usable]
+
+
+class JitterBuffer:
+    """线程安全的PCM字节缓冲：下载线程写入，音频回调读取，数据不足时补静音"""
+
+    def __init__(self):
+        self._data = bytearray()
+        self._lock = Lock()
+        self.closed = False
+
+    @property
+    def available(self):
+        return len(self._data)
+
+    def write(self, data):
+        with self._lock:
+            self._data += data
+
+    def read(self, size):
+        """读取最多size字节"""
+        with self._lock:
+            data = bytes(self._data[:size])
+            del self._data[:size]
+            return data
+
+    def close(self):
+        """标记数据已全部写入"""
+        self.closed = True
+
+
+class ChunkStream:
+    """按顺序传递音频字节块的通道：合成线程写入，播放线程边收边播"""
+
+    def __init__(self):
+        self._chunks = queue.Queue()
+
+    def write(self, chunk):
+        self._chunks.put(chunk)
+
+    def close(self):
+        self._chunks.put(None)
+
+    def __iter__(self):
+        while True:
+            chunk = self._chunks.get()
+            if chunk is None:
+                return
+            yield chunk
+
+
+class AudioPlayer:
+    def __init__(self, blocksize=1024):
+        """初始化播放器，同一时间只播放一段音频"""
+        self.blocksize = blocksize
+        self._stream = None
+        self._finished = Event()
+        self._finished.set()
+        self._stop_requested = Event()
+        self._lock = Lock()
+
+    def play_stream(self, chunks, prebuffer_ms=200, timeout_margin=5.0, on_start=None):
+        """边接收WAV字节块边播放，缓冲满prebuffer_ms毫秒后开始出声，返回是否完整播放
+
+        on_start在输出流启动（开始出声）时调用
+        """
+        self._stop_requested.clear()
+        parser = WavStreamParser()
+        buffer = JitterBuffer()
+        started = False
+
+        for chunk in chunks:
+            if self._stop_requested.is_set():
+                break
+            pcm = parser.feed(chunk)
+            if pcm:
+                buffer.write(pcm)
+            if (not started and parser.format and
+                    buffer.available >= parser.format.bytes_per_second * prebuffer_ms / 1000):
+                self._start_stream(parser.format, buffer)
+                started = True
+                if on_start:
+                    on_start()
+        buffer.close()
+
+        if self._stop_requested.is_set():
+            self._close(abort=True)
+            return False
+        if not started:
+            if parser.format is None or buffer.available == 0:
+                return False
+            # 整段音频比预缓冲还短
+            self._start_stream(parser.format, buffer)
+            if on_start:
+                on_start()
+
+        remaining = buffer.available / parser.format.bytes_per_second
+        completed = self._finished.wait(remaining + timeout_margin)
+        self._close(abort=not completed)
+        return completed and not self._stop_requested.is_set()
+
+    def _start_stream(self, wav_format, buffer):
+        silence = b"\x80" if wav_format.sample_width == 1 else b"\x00"
+
+        def callback(outdata, frames, time, status):
+            size = frames * wav_format.frame_size
+            data = buffer.read(size)
+            outdata[:len(data)] = data
+            if len(data) < size:
+                # 数据未到时输出静音等待；数据已全部写入则播放结束
+                outdata[len(data):] = silence * (size - len(data))
+                if buffer.closed and buffer.available == 0:
+                    raise sd.CallbackStop()
+
+        with self._lock:
+            self._finished.clear()
+            self._stream = sd.RawOutputStream(
+                samplerate=wav_format.sample_rate,
+                channels=wav_format.channels,
+                dtype=np.dtype(SAMPLE_DTYPES[wav_format.sample_width]).name,
+                blocksize=self.blocksize,
+                callback=callback,
+                finished_callback=self._finished.set
+            )
+            self._stream.start()
+
+    def stop(self):
+        """立即停止当前播放"""
+        self._stop_requested.set()
+        self._close(abort=True)
+
+    def _close(self, abort=False):
+        with self._lock:
+            stream, self._stream = self._stream, None
+        if stream is None:
+            return
+        try:
+            if abort:
+                stream.abort()
+            stream.close()
+        except Exception as e:
+            print(f" 关闭音频输出流失败: {e}")
+        self._finished.set()
@@ -0,0 +1,466 @@
+"""
+多会话服务模块
+无界面的本机HTTP + WebSocket服务：多个前端终端共用一份已加载的识别模型、大模型连接和TTS，
+每个会话有独立的对话历史；识别、生成、合成分别经过有界的共享槽位，按会话轮转分配
+
+运行: python chat_server.py
+"""
+import json
+import time
+import uuid
+import asyncio
+import numpy as np
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from aiohttp import web, WSMsgType
+from speech_recognizer import SpeechRecognizer, Utterance
+from tts_service import TTSSynthesizer
+from ai_client import AIClient, AsyncAIClient, OllamaError
+from audio_player import decode_wav
+from conversation_context import ConversationContext
+from sentence_segmenter import SentenceSegmenter
+import config
+
+
+class SessionBusy(Exception):
+    """会话排队的请求过多"""
+
+
+class FairPool:
+    """有界并发槽位：空闲槽位按会话轮转分配，单个会话排队再多也不会占满所有槽位"""
+
+    def __init__(self, capacity, max_waiting_per_session=4):
+        self.capacity = capacity
+        self.max_waiting_per_session = max_waiting_per_session
+        self._active = 0
+        self._waiters = OrderedDict()  # 会话ID -> 等待中的future队列，按轮转顺序排列
+
+    async def acquire(self, session_id):
+        if self._active < self.capacity and not self._waiters:
+            self._active += 1
+            return
+
+        waiters = self._waiters.setdefault(session_id, deque())
+        if len(waiters) >= self.max_waiting_per_session:
+            if not waiters:
+                del self._waiters[session_id]
+            raise SessionBusy()
+        future = asyncio.get_running_loop().create_future()
+        waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 槽位已经分配，但等待方被取消
+                self.release()
+            else:
+                self._discard(session_id, future)
+            raise
+
+    def release(self):
+        self._active -= 1
+        self._grant()
+
+    @asynccontextmanager
+    async def slot(self, session_id):
+        await self.acquire(session_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def run_in_executor(self, session_id, executor, func, *args):
+        """占用一个槽位在线程池中执行func
+
+        等待方被取消时线程中的调用仍会继续，槽位一直占用到调用真正结束才释放，
+        避免取消后新的请求与仍在运行的调用同时占用模型
+        """
+        await self.acquire(session_id)
+        try:
+            future = asyncio.get_running_loop().run_in_executor(executor, func, *args)
+        except BaseException:
+            self.release()
+            raise
+        future.add_done_callback(self._release_after)
+        return await asyncio.shield(future)
+
+    def _release_after(self, future):
+        if not future.cancelled():
+            # 等待方已取消时结果无人读取，在此取出异常避免告警
+            future.exception()
+        self.release()
+
+    def _grant(self):
+        while self._active < self.capacity and self._waiters:
+            session_id, waiters = next(iter(self._waiters.items()))
+            future = waiters.popleft()
+            # 分配后该会话排到队尾
+            if waiters:
+                self._waiters.move_to_end(session_id)
+            else:
+                del self._waiters[session_id]
+            if future.done():
+                continue
+            self._active += 1
+            future.set_result(None)
+
+    def _discard(self, session_id, future):
+        waiters = self._waiters.get(session_id)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiters[session_id]
+
+
+class ChatSession:
+    def __init__(self, session_id, context):
+        self.session_id = session_id
+        self.context = context
+        self.turn_task = None
+        self.last_active = time.monotonic()
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+    @property
+    def busy(self):
+        return self.turn_task is not None and not self.turn_task.done()
+
+    def cancel(self):
+        """取消正在进行的一轮对话"""
+        if self.busy:
+            self.turn_task.cancel()
+            return True
+        return False
+
+
+def decode_audio(data, sample_rate=16000):
+    """把客户端上传的WAV数据转为识别用的单声道float32采样，采样率不同时线性重采样"""
+    samples, source_rate = decode_wav(data)
+    if samples.dtype == np.uint8:
+        audio = (samples.astype(np.float32) - 128.0) / 128.0
+    else:
+        audio = samples.astype(np.float32) / float(np.iinfo(samples.dtype).max + 1)
+    audio = audio.mean(axis=1)
+    if source_rate != sample_rate and len(audio):
+        length = int(len(audio) * sample_rate / source_rate)
+        audio = np.interp(np.arange(length) * (source_rate / sample_rate),
+                          np.arange(len(audio)), audio).astype(np.float32)
+    return audio
+
+
+class ChatServer:
+    def __init__(self, host="127.0.0.1", port=8765, enable_tts=True, max_sessions=16, idle_timeout=1800,
+                 asr_workers=1, llm_workers=2, tts_workers=2, max_waiting_per_session=4):
+        """初始化服务
+
+        asr_workers/llm_workers/tts_workers: 同时进行的识别、生成、合成数量上限
+        max_waiting_per_session: 单个会话在每个槽位上最多排队的请求数
+        idle_timeout: 会话空闲超过该秒数后清除
+        """
+        self.host = host
+        self.port = port
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+
+        self.speech_recognizer = SpeechRecognizer(
+            config.ASR_MODEL_SIZE,
+            backend=config.ASR_BACKEND,
+            device=config.ASR_DEVICE,
+            compute_type=config.ASR_COMPUTE_TYPE
+        )
+        # 服务只负责合成并把音频发给客户端，不创建本机的播放器和播报线程
+        self.tts_synthesizer = TTSSynthesizer(
+            config.TTS_URL,
+            cache_dir=config.TTS_CACHE_DIR,
+            cache_memory_bytes=config.TTS_CACHE_MEMORY_BYTES,
+            cache_disk_bytes=config.TTS_CACHE_DISK_BYTES
+        ) if enable_tts else None
+        # 同步客户端用于连接检查、预加载和生成摘要；对话请求在服务的事件循环中异步发送
+        self.ai_client = AIClient(
+            config.OLLAMA_URL,
+            config.OLLAMA_MODEL,
+            summary_model=config.OLLAMA_SUMMARY_MODEL,
+            keep_alive=config.OLLAMA_KEEP_ALIVE,
+            options={"num_ctx": config.OLLAMA_NUM_CTX, "num_predict": config.OLLAMA_NUM_PREDICT}
+        )
+        self.llm_client = AsyncAIClient(config.OLLAMA_URL, config.OLLAMA_MODEL,
+                                        connect_timeout=config.HTTP_CONNECT_TIMEOUT,
+                                        max_connections=llm_workers)
+
+        self.asr_pool = FairPool(asr_workers, max_waiting_per_session)
+        self.llm_pool = FairPool(llm_workers, max_waiting_per_session)
+        self.tts_pool = FairPool(tts_workers, max_waiting_per_session)
+        self.executor = ThreadPoolExecutor(max_workers=asr_workers + tts_workers)
+        self.sessions = {}
+
+    def create_session(self):
+        if len(self.sessions) >= self.max_sessions:
+            return None
+        session_id = uuid.uuid4().hex
+        context = ConversationContext(config.OLLAMA_CONTEXT_TOKENS, system_prompt=config.OLLAMA_SYSTEM_PROMPT,
+                                      summarizer=self.ai_client.summarize)
+        session = ChatSession(session_id, context)
+        self.sessions[session_id] = session
+        print(f" 新会话: {session_id}（当前 {len(self.sessions)} 个）")
+        return session
+
+    def close_session(self, session_id):
+        session = self.sessions.pop(session_id, None)
+        if session:
+            session.cancel()
+            print(f" 会话结束: {session_id}")
+        return session is not None
+
+    async def run_turn(self, session, text=None, audio=None, send_event=None, send_audio=None):
+        """处理一轮对话：识别（若有音频）→ 流式生成 → 逐句合成，返回(识别文本, 回复)"""
+        sid = session.session_id
+
+        async def emit(event):
+            if send_event:
+                await send_event(event)
+
+        if audio is not None:
+            text = await self.asr_pool.run_in_executor(
+                sid, self.executor, self.speech_recognizer.recognize,
+                Utterance(audio, self.speech_recognizer.sample_rate)
+            )
+            await emit({"type": "transcript", "text": text or ""})
+
+        if not text or not text.strip():
+            reply = "我没有听清楚您说的话，请再说一遍。"
+            await emit({"type": "done", "text": reply})
+            return text or "", reply
+
+        speaker = None
+        sentences = None
+        segmenter = SentenceSegmenter()
+        if send_audio and self.tts_synthesizer:
+            sentences = asyncio.Queue()
+            speaker = asyncio.ensure_future(self._speak(sid, sentences, send_audio))
+
+        session.context.add("user", text)
+        messages = session.context.build_messages()
+        parts = []
+        try:
+            async with self.llm_pool.slot(sid):
+                async for content in self.llm_client.stream_chat(messages, **self.ai_client.request_options()):
+                    parts.append(content)
+                    await emit({"type": "token", "content": content})
+                    if speaker:
+                        for sentence in segmenter.feed(content):
+                            sentences.put_nowait(sentence)
+        except BaseException:
+            # 取消或出错：保留已生成的部分，没有回复的问题不留在历史中
+            if parts:
+                session.context.add("assistant", "".join(parts))
+            else:
+                session.context.drop_unanswered()
+            if speaker:
+                speaker.cancel()
+            raise
+
+        reply = "".join(parts)
+        session.context.add("assistant", reply)
+        if speaker:
+            for sentence in segmenter.flush():
+                sentences.put_nowait(sentence)
+            sentences.put_nowait(None)
+            await speaker
+        await emit({"type": "done", "text": reply})
+        return text, reply
+
+    async def _speak(self, session_id, sentences, send_audio):
+        """按顺序合成句子并发送WAV数据，每句单独占用一个合成槽位以便各会话轮流合成"""
+        while True:
+            sentence = await sentences.get()
+            if sentence is None:
+                return
+            cleaned_text = self.tts_synthesizer.clean_text_for_tts(sentence)
+            audio_content = await self.tts_pool.run_in_executor(
+                session_id, self.executor, self.tts_synthesizer.synthesize, cleaned_text
+            )
+            if audio_content:
+                await send_audio(audio_content)
+
+    def start_turn(self, session, **kwargs):
+        """开始新一轮对话，同一会话中尚未结束的上一轮被打断"""
+        session.cancel()
+        session.touch()
+        session.turn_task = asyncio.ensure_future(self.run_turn(session, **kwargs))
+        return session.turn_task
+
+    # ---- HTTP接口 ----
+
+    async def handle_create_session(self, request):
+        session = self.create_session()
+        if session is None:
+            return web.json_response({"error": "会话数已达上限"}, status=503)
+        return web.json_response({"session_id": session.session_id})
+
+    async def handle_close_session(self, request):
+        if not self.close_session(request.match_info["session_id"]):
+            return web.json_response({"error": "会话不存在"}, status=404)
+        return web.json_response({"ok": True})
+
+    async def handle_turn(self, request):
+        """一轮对话：请求体为WAV音频，或JSON {"text": ...}；返回识别文本与完整回复"""
+        session = self.sessions.get(request.match_info["session_id"])
+        if session is None:
+            return web.json_response({"error": "会话不存在"}, status=404)
+
+        try:
+            if request.content_type in ("audio/wav", "audio/x-wav", "application/octet-stream"):
+                kwargs = {"audio": decode_audio(await request.read())}
+            else:
+                kwargs = {"text": (await request.json()).get("text", "")}
+        except Exception as e:
+            return web.json_response({"error": f"无效的请求: {e}"}, status=400)
+
+        task = self.start_turn(session, **kwargs)
+        try:
+            await asyncio.wait([task])
+        except asyncio.CancelledError:
+            # 客户端断开连接
+            task.cancel()
+            raise
+        if task.cancelled():
+            return web.json_response({"error": "已被新的请求打断"}, status=409)
+        try:
+            text, reply = task.result()
+        except SessionBusy:
+            return web.json_response({"error": "请求过多，请稍后再试"}, status=429)
+        except OllamaError as e:
+            return web.json_response({"error": str(e)}, status=502)
+        return web.json_response({"text": text, "reply": reply})
+
+    async def handle_health(self, request):
+        return web.json_response({
+            "ready": self.speech_recognizer.is_ready,
+            "sessions": len(self.sessions),
+            "tts": self.tts_synthesizer is not None
+        })
+
+    # ---- WebSocket接口 ----
+
+    async def handle_websocket(self, request):
+        """WebSocket会话：文本消息为JSON指令，二进制消息为一段WAV录音
+
+        指令: {"type": "text", "text": ..., "speak": true} / {"type": "cancel"}
+        推送: session / transcript / token / done / error 事件（JSON），以及每句回复的WAV音频（二进制）
+        """
+        session = self.sessions.get(request.query.get("session", ""))
+        if session is None:
+            session = self.create_session()
+            if session is None:
+                return web.json_response({"error": "会话数已达上限"}, status=503)
+
+        ws = web.WebSocketResponse(heartbeat=30)
+        await ws.prepare(request)
+        await ws.send_json({"type": "session", "session_id": session.session_id})
+
+        async def send_event(event):
+            if not ws.closed:
+                await ws.send_json(event)
+
+        async def send_audio(audio_content):
+            if not ws.closed:
+                await ws.send_bytes(audio_content)
+
+        async for message in ws:
+            session.touch()
+            try:
+                if message.type == WSMsgType.BINARY:
+                    self._start_ws_turn(session, send_event, audio=decode_audio(message.data),
+                                        send_audio=send_audio)
+                elif message.type == WSMsgType.TEXT:
+                    data = json.loads(message.data)
+                    if data.get("type") == "cancel":
+                        session.cancel()
+                    elif data.get("type") == "text":
+                        self._start_ws_turn(session, send_event, text=data.get("text", ""),
+                                            send_audio=send_audio if data.get("speak", True) else None)
+            except Exception as e:
+                await send_event({"type": "error", "message": f"无效的消息: {e}"})
+
+        # 连接断开时停止生成，会话与历史保留到空闲超时，可用同一session参数重连
+        session.cancel()
+        return ws
+
+    def _start_ws_turn(self, session, send_event, **kwargs):
+        task = self.start_turn(session, send_event=send_event, **kwargs)
+
+        def report(task):
+            if task.cancelled():
+                return
+            error = task.exception()
+            if error is None:
+                return
+            message = "请求过多，请稍后再试" if isinstance(error, SessionBusy) else str(error)
+            asyncio.ensure_future(send_event({"type": "error", "message": message}))
+
+        task.add_done_callback(report)
+
+    # ---- 启动与清理 ----
+
+    async def expire_sessions(self):
+        """定期清除空闲过久的会话"""
+        while True:
+            await asyncio.sleep(60)
+            now = time.monotonic()
+            for session_id, session in list(self.sessions.items()):
+                if not session.busy and now - session.last_active > self.idle_timeout:
+                    self.close_session(session_id)
+
+    async def on_startup(self, app):
+        loop = asyncio.get_running_loop()
+        if not await loop.run_in_executor(None, self.ai_client.check_connection):
+            print(" 请先启动Ollama服务: ollama serve")
+        else:
+            self.ai_client.preload()
+        if self.tts_synthesizer and not await loop.run_in_executor(None, self.tts_synthesizer.check_connection):
+            print(" TTS服务不可用，将仅返回文字回复")
+            self.tts_synthesizer = None
+        await loop.run_in_executor(None, self.speech_recognizer.load_model)
+        app["expire_task"] = asyncio.ensure_future(self.expire_sessions())
+
+    async def on_cleanup(self, app):
+        app["expire_task"].cancel()
+        for session_id in list(self.sessions):
+            self.close_session(session_id)
+        await self.llm_client.close()
+        self.executor.shutdown(wait=False)
+
+    def create_app(self):
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_post("/sessions", self.handle_create_session)
+        app.router.add_delete("/sessions/{session_id}", self.handle_close_session)
+        app.router.add_post("/sessions/{session_id}/turn", self.handle_turn)
+        app.router.add_get("/ws", self.handle_websocket)
+        app.router.add_get("/health", self.handle_health)
+        app.on_startup.append(self.on_startup)
+        app.on_cleanup.append(self.on_cleanup)
+        return app
+
+    def run(self):
+        print(f" 多会话服务启动: http://{self.host}:{self.port}")
+        web.run_app(self.create_app(), host=self.host, port=self.port, print=None)
+
+
+def main():
+    server = ChatServer(
+        host=config.SERVER_HOST,
+        port=config.SERVER_PORT,
+        max_sessions=config.SERVER_MAX_SESSIONS,
+        idle_timeout=config.SERVER_SESSION_IDLE_TIMEOUT,
+        asr_workers=config.SERVER_ASR_WORKERS,
+        llm_workers=config.SERVER_LLM_WORKERS,
+        tts_workers=config.SERVER_TTS_WORKERS,
+        max_waiting_per_session=config.SERVER_MAX_WAITING_PER_SESSION
+    )
+    server.run()
+
+
+if __name__ == "__main__":
+    main()
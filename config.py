@@ -0,0 +1,80 @@
+"""
+配置模块
+集中管理各组件的可调参数
+"""
+
+# 语音识别
+ASR_BACKEND = "faster-whisper"  # "faster-whisper"（CTranslate2，CPU int8）或 "whisper"（openai-whisper）
+ASR_MODEL_SIZE = "base"
+ASR_DEVICE = "cpu"
+ASR_COMPUTE_TYPE = "int8"  # faster-whisper计算类型: int8 / int8_float16 / float16 / float32
+ASR_STREAMING = True  # 按住空格期间增量识别
+ASR_AUTO_ENDPOINT = False  # 免按住模式：说完后自动结束录音
+
+# 监听模式
+LISTEN_MODE = "push_to_talk"  # "push_to_talk"（按住空格）或 "wake_word"（持续监听唤醒词）
+WAKE_WORDS = ["爱莉希雅", "爱莉希亚", "艾莉希雅", "爱丽希雅"]  # 唤醒词及常见的同音识别结果
+WAKE_WORD_MODEL_SIZE = "tiny"  # 唤醒词检测使用的小模型
+WAKE_WORD_THRESHOLD = 0.75  # 模糊匹配相似度阈值
+
+# 界面
+HOTKEYS = {"talk": "space", "exit": "esc"}  # 动作 -> 按键名（keyboard库的按键名）
+HOTKEY_DEBOUNCE_MS = 30  # 松开后在该时间内又按下视为按键抖动
+GUI_FRAME_INTERVAL_MS = 25  # 流式回复按帧合并刷新的间隔（毫秒），16~33之间
+
+# 对话轮次（回复进行中又提出的新问题）
+# 开始录音（或说出唤醒词）时：interrupt策略立即停止当前回复的生成和播报；
+# queue/merge策略不打断，当前回复完整生成并播报完，再回答新的问题
+TURN_POLICY = "queue"  # "queue"（依次回答）、"interrupt"（打断当前回复）或 "merge"（合并成一轮回答）
+TURN_MAX_PENDING = 3  # 最多等待的轮数，超出时并入最后一轮
+
+# 大模型
+OLLAMA_URL = "http://localhost:11434/api/chat"
+OLLAMA_MODEL = "Elysia"
+OLLAMA_CONTEXT_TOKENS = 2048  # 对话历史的token预算，超出时较早的轮次被折叠为摘要
+OLLAMA_SYSTEM_PROMPT = None  # 固定的系统提示；设置后会替换Modelfile中的SYSTEM提示词（人设），需把人设一并写入
+OLLAMA_SUMMARY_MODEL = None  # 生成摘要使用的模型，None表示与对话模型相同
+OLLAMA_KEEP_ALIVE = "30m"  # 空闲多久后Ollama卸载模型，-1表示常驻
+OLLAMA_NUM_CTX = 4096  # 模型上下文窗口，需大于对话历史预算加回复长度
+OLLAMA_NUM_PREDICT = 512  # 单次回复的最大token数
+LLM_SPECULATIVE_PREFILL = True  # 录音期间用已确认的部分识别文本预热提示缓存（需开启ASR_STREAMING）
+
+# 回复缓存（常见问候与固定问题直接用缓存的回复）
+RESPONSE_CACHE_ENABLED = False
+RESPONSE_CACHE_MAX_ENTRIES = 256
+RESPONSE_CACHE_TTL = 3600  # 缓存有效期（秒）
+RESPONSE_CACHE_FUZZY_THRESHOLD = None  # 模糊匹配的字符n-gram相似度阈值（如0.85），None表示只精确匹配
+RESPONSE_CACHE_CONTEXT_MESSAGES = 2  # 计入缓存键的最近消息数（默认为上一轮问答），0表示忽略对话历史（追问可能命中无关回答）
+
+# 语音合成
+TTS_URL = "http://127.0.0.1:9880"
+TTS_CACHE_DIR = "tts_cache"  # 合成音频的磁盘缓存目录，None表示只用内存缓存
+TTS_CACHE_MEMORY_BYTES = 32 * 1024 * 1024  # 内存缓存字节上限
+TTS_CACHE_DISK_BYTES = 256 * 1024 * 1024  # 磁盘缓存字节上限，超出时删除最久未使用的音频；None表示不限
+TTS_PREBUFFER_MS = 200  # 边下载边播放时，缓冲多少毫秒音频后开始出声
+TTS_MAX_PENDING_SENTENCES = 32  # 播报队列中最多等待合成的句子数
+
+# 多会话服务模式（python chat_server.py）
+SERVER_HOST = "127.0.0.1"  # 只监听本机
+SERVER_PORT = 8765
+SERVER_MAX_SESSIONS = 16
+SERVER_SESSION_IDLE_TIMEOUT = 1800  # 会话空闲超过该秒数后清除
+SERVER_ASR_WORKERS = 1  # 同时进行的识别数（模型调用本身是串行的）
+SERVER_LLM_WORKERS = 2  # 同时进行的生成数
+SERVER_TTS_WORKERS = 2  # 同时进行的合成数
+SERVER_MAX_WAITING_PER_SESSION = 4  # 单个会话在每类任务上最多排队的请求数
+
+# 延迟追踪（python latency_trace.py 查看各阶段耗时统计）
+TRACE_ENABLED = True
+TRACE_FILE = "latency_trace.jsonl"  # 每轮对话一行JSON
+TRACE_MAX_BYTES = 5 * 1024 * 1024  # 超过该大小时轮转
+TRACE_BACKUP_COUNT = 3  # 保留的轮转文件数
+
+# HTTP连接（Ollama与TTS共用连接池）
+HTTP_POOL_CONNECTIONS = 4  # 缓存的主机连接池个数
+HTTP_POOL_MAXSIZE = 8  # 每个主机保持的最大连接数
+HTTP_CONNECT_TIMEOUT = 3.05  # 建立连接超时（秒）
+HTTP_READ_TIMEOUT = 60  # 默认读取超时（秒）
+HTTP_MAX_RETRIES = 2  # 失败后的重试次数
+HTTP_BACKOFF_BASE = 0.5  # 指数退避的初始等待（秒）
+HTTP_BACKOFF_MAX = 8.0  # 单次等待上限（秒）
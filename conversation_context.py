@@ -0,0 +1,156 @@
+"""
+对话上下文模块
+按token预算管理对话历史：超出预算时一次性淘汰较早的轮次（回落到低水位），
+被淘汰的内容在后台折叠进滚动摘要。两次淘汰之间提示词前缀保持不变，便于Ollama复用KV缓存
+"""
+import re
+import logging
+from threading import Lock, Thread
+
+logger = logging.getLogger(__name__)
+
+CJK_PATTERN = re.compile(r'[㐀-鿿豈-﫿]')
+WORD_PATTERN = re.compile(r'[A-Za-z0-9_]+')
+MESSAGE_OVERHEAD = 4  # 每条消息的角色标记等模板开销
+SUMMARY_ACK = "好的，我记得之前聊过的这些。"
+
+
+def estimate_tokens(text):
+    """粗略估计token数：汉字约1个token，英文单词约1.3个，其余符号各算1个"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    words = WORD_PATTERN.findall(text)
+    word_chars = sum(len(word) for word in words)
+    others = len(re.sub(r'\s', '', text)) - cjk - word_chars
+    return cjk + int(len(words) * 1.3 + 0.5) + max(others, 0)
+
+
+class ConversationContext:
+    def __init__(self, max_tokens=2048, low_water=0.6, system_prompt=None, summarizer=None,
+                 min_recent_messages=2):
+        """初始化对话上下文
+
+        max_tokens: 历史（含摘要）的token预算，超出时触发淘汰
+        low_water: 淘汰后回落到预算的比例，留出余量使前缀在多轮内保持稳定
+        summarizer: summarizer(previous_summary, evicted_messages) -> 新摘要，在后台线程调用
+        min_recent_messages: 至少保留的最近消息数
+        """
+        self.max_tokens = max_tokens
+        self.low_water = low_water
+        self.system_prompt = system_prompt
+        self.summarizer = summarizer
+        self.min_recent_messages = min_recent_messages
+        self.summary = ""
+        self.messages = []
+        self._token_counts = []
+        self._pending_evicted = []
+        self._summarizing = False
+        self._generation = 0  # clear()时递增，丢弃清空之前开始的摘要结果
+        self._lock = Lock()
+
+    def add(self, role, content):
+        """追加一条消息，必要时淘汰较早的轮次"""
+        with self._lock:
+            self.messages.append({"role": role, "content": content})
+            self._token_counts.append(estimate_tokens(content) + MESSAGE_OVERHEAD)
+            if role == "assistant":
+                self._maybe_evict()
+
+    def recent(self, count):
+        """最近count条消息的副本"""
+        with self._lock:
+            return list(self.messages[-count:]) if count > 0 else []
+
+    def drop_unanswered(self):
+        """移除末尾没有得到回复的用户消息"""
+        with self._lock:
+            if self.messages and self.messages[-1]["role"] == "user":
+                self.messages.pop()
+                self._token_counts.pop()
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self.messages = []
+            self._token_counts = []
+            self._pending_evicted = []
+            self._generation += 1
+
+    @property
+    def total_tokens(self):
+        return self._prefix_tokens() + sum(self._token_counts)
+
+    def build_messages(self):
+        """生成发送给模型的消息列表：固定前缀（系统提示、摘要）+ 最近的对话
+
+        摘要以一问一答的形式放在对话开头，而不是作为system消息：
+        首条消息为system时Ollama不再加入Modelfile中的SYSTEM提示词，模型会丢失自带的人设
+        """
+        with self._lock:
+            messages = []
+            if self.system_prompt:
+                messages.append({"role": "system", "content": self.system_prompt})
+            if self.summary:
+                messages.append({"role": "user", "content": f"之前对话的摘要：{self.summary}"})
+                messages.append({"role": "assistant", "content": SUMMARY_ACK})
+            messages.extend(self.messages)
+            return messages
+
+    def _prefix_tokens(self):
+        tokens = 0
+        if self.system_prompt:
+            tokens += estimate_tokens(self.system_prompt) + MESSAGE_OVERHEAD
+        if self.summary:
+            tokens += (estimate_tokens(self.summary) + 8 + estimate_tokens(SUMMARY_ACK) +
+                       2 * MESSAGE_OVERHEAD)
+        return tokens
+
+    def _maybe_evict(self):
+        if self.total_tokens <= self.max_tokens:
+            return
+
+        # 一次淘汰到低水位，而不是每轮淘汰一条，减少前缀变化的次数
+        target = self.max_tokens * self.low_water
+        evicted = []
+        while (len(self.messages) > self.min_recent_messages and
+               self.total_tokens > target):
+            evicted.append(self.messages.pop(0))
+            self._token_counts.pop(0)
+            # 按完整的一问一答淘汰，避免以assistant消息开头
+            if self.messages and self.messages[0]["role"] == "assistant" and \
+                    len(self.messages) > self.min_recent_messages:
+                evicted.append(self.messages.pop(0))
+                self._token_counts.pop(0)
+
+        if not evicted:
+            return
+        logger.info(f"上下文超出预算，淘汰 {len(evicted)} 条消息")
+        self._pending_evicted.extend(evicted)
+        if self.summarizer and not self._summarizing:
+            self._summarizing = True
+            Thread(target=self._summarize, daemon=True).start()
+
+    def _summarize(self):
+        """在后台把被淘汰的消息折叠进摘要，期间新淘汰的消息在下一轮处理；
+        失败时被淘汰的消息放回待处理队列开头，下次淘汰时重试"""
+        while True:
+            with self._lock:
+                evicted, self._pending_evicted = self._pending_evicted, []
+                previous_summary = self.summary
+                generation = self._generation
+                if not evicted:
+                    self._summarizing = False
+                    return
+            try:
+                summary = self.summarizer(previous_summary, evicted)
+            except Exception as e:
+                logger.error(f"生成对话摘要失败: {e}")
+                with self._lock:
+                    if generation == self._generation:
+                        self._pending_evicted[:0] = evicted
+                    self._summarizing = False
+                return
+            with self._lock:
+                if generation == self._generation:
+                    self.summary = summary
@@ -1,11 +1,26 @@
 import sys
 import os
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QVBoxLayout, QHBoxLayout,
-                             QWidget, QLabel, QFrame, QScrollArea, QSizePolicy)
+                             QWidget, QLabel, QFrame, QPlainTextEdit, QSizePolicy)
 from PyQt5.QtCore import Qt, QTimer, pyqtSignal
-from PyQt5.QtGui import QFont, QPalette, QColor, QFontMetrics
-import keyboard
+from PyQt5.QtGui import QFont, QPalette, QColor, QFontMetrics, QTextCursor
 import time
+from hotkeys import HotkeyListener
+from turn_state import IDLE, LOADING, RECORDING, TRANSCRIBING, GENERATING, SPEAKING
+import config
+
+
+# 各对话状态对应的提示（图标类型，文本）
+STATUS_MESSAGES = {
+    IDLE: ("ready", "我在的哟，是不是想我啦？"),
+    # 模型仍在后台加载，此时已可以录音，录音会在加载完成后识别
+    LOADING: ("loading", "我正在醒来哦，稍等一下下~"),
+    RECORDING: ("recording", "我在听哦"),
+    # 识别在后台进行，界面保持响应
+    TRANSCRIBING: ("processing", "让我想想你说了什么~"),
+    GENERATING: ("processing", "我在处理你的问题啦"),
+    SPEAKING: ("speaking", "我在说给你听哦~"),
+}
 
 
 class VoiceChatGUI(QMainWindow):
@@ -15,13 +30,20 @@ class VoiceChatGUI(QMainWindow):
     exit_program_signal = pyqtSignal()
     # 用于从工作线程安全地传递AI响应到GUI主线程
     ai_response_signal = pyqtSignal(str, bool)
+    # 后台模型加载与服务检查完成（是否成功，错误信息）
+    system_ready_signal = pyqtSignal(bool, str)
+    # 热键钩子线程与音频回调线程发来的事件
+    hotkey_pressed_signal = pyqtSignal(str)
+    hotkey_released_signal = pyqtSignal(str)
+    endpoint_signal = pyqtSignal()
+    # 对话状态变化（新状态）
+    state_changed_signal = pyqtSignal(str)
 
     def __init__(self, voice_chat_system):
         super().__init__()
         self.voice_chat_system = voice_chat_system
-        self.current_response = ""
+        self.has_response = False  # 是否正在显示流式回复（回复文本只保存在文本区域的文档中）
         self.is_processing = False
-        self.space_pressed = False
         # 将后台线程发来的AI响应信号连接到GUI更新方法（保证在主线程执行）
         self.ai_response_signal.connect(self.append_ai_response)
         # 常态高度（闲置时显示为圆角长方形）与展开最大高度
@@ -29,6 +51,13 @@ class VoiceChatGUI(QMainWindow):
         self.expanded_max_height = 420
         self.collapse_delay_ms = 3000  # 完成后等待多少毫秒收缩
         self._collapse_timer = None
+        # 窗口尺寸调整合并到每帧最多一次
+        self.resize_interval_ms = 16
+        self._resize_timer = QTimer(self)
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.timeout.connect(self.adjust_window_size)
+        self._scroll_state = None
+        self._reset_layout_cache(None)
         self.init_ui()
         self.setup_keyboard_listener()
 
@@ -75,55 +104,39 @@ class VoiceChatGUI(QMainWindow):
         status_layout.setSpacing(6)
 
         # 状态文本（用于显示待机、录音提示及流式AI回复）
-        self.status_label = QLabel("等待中...")
+        # 使用 QPlainTextEdit：流式回复通过文档光标追加，不必每批都重新排版整段回复；
+        # 它本身带滚动条，内容过高时显示垂直滚动条
+        self.status_text = QPlainTextEdit()
+        self.status_text.setReadOnly(True)
+        self.status_text.setPlainText("等待中...")
         # 使用更大的字体以提高可读性
         font = QFont()
         font.setPointSize(14)
-        self.status_label.setFont(font)
-        self.status_label.setStyleSheet("""
-            QLabel {
+        self.status_text.setFont(font)
+        self.status_text.setStyleSheet("""
+            QPlainTextEdit {
                 color: #8B008B;
                 background: transparent;
+                border: none;
             }
         """)
-        self.status_label.setWordWrap(True)
-        self.status_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
-
-        # 使用 QScrollArea 包裹状态文本，当内容过高时显示垂直滚动条
-        self.scroll_area = QScrollArea()
-        self.scroll_area.setWidgetResizable(True)
-        self.scroll_area.setFrameShape(QFrame.NoFrame)
-        self.scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        self.scroll_area.setWidget(self.status_label)
-        # 让 scroll_area 在水平方向填满可用空间，避免右端不对齐
-        self.scroll_area.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
-        self.status_label.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Preferred)
-        # 清除内边距，确保文本右端贴合滚动区域边界
-        try:
-            self.scroll_area.setContentsMargins(0, 0, 0, 0)
-            self.status_label.setContentsMargins(0, 0, 0, 0)
-        except:
-            pass
+        self.status_text.setLineWrapMode(QPlainTextEdit.WidgetWidth)
+        self.status_text.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        self.status_text.setFrameShape(QFrame.NoFrame)
+        self.status_text.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.status_text.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        # 让文本区域在水平方向填满可用空间，避免右端不对齐
+        self.status_text.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
+        # 清除内边距，确保文本右端贴合边界
         try:
-            # QLabel 有时会有内部 margin，确保为 0
-            self.status_label.setMargin(0)
+            self.status_text.setContentsMargins(0, 0, 0, 0)
+            self.status_text.document().setDocumentMargin(0)
         except:
             pass
-        # 确保文本没有背景：让 scroll area 的 viewport 和 label 都透明
+        # 确保文本没有背景：让 viewport 透明
         try:
-            self.scroll_area.setStyleSheet("background: transparent;")
-            self.scroll_area.viewport().setStyleSheet("background: transparent;")
-        except:
-            pass
-        try:
-            self.status_label.setAttribute(Qt.WA_TranslucentBackground, True)
-            self.status_label.setAutoFillBackground(False)
-        except:
-            pass
-        # 确保文本左上对齐，便于计算并且右端能对齐边框
-        try:
-            self.status_label.setAlignment(Qt.AlignLeft | Qt.AlignTop)
+            self.status_text.viewport().setStyleSheet("background: transparent;")
+            self.status_text.viewport().setAutoFillBackground(False)
         except:
             pass
 
@@ -139,7 +152,7 @@ class VoiceChatGUI(QMainWindow):
         """)
         self.recording_indicator.hide()
 
-        status_layout.addWidget(self.scroll_area)
+        status_layout.addWidget(self.status_text)
         status_layout.addWidget(self.recording_indicator)
 
         frame_layout.addLayout(status_layout)
@@ -152,19 +165,28 @@ class VoiceChatGUI(QMainWindow):
         # 设置初始状态
         self.update_status("ready", "我在的哟，是不是想我啦？")
 
-        # 启动状态更新定时器
-        self.status_timer = QTimer()
-        self.status_timer.timeout.connect(self.update_system_status)
-        self.status_timer.start(100)
+        # 订阅对话状态变化（由各工作线程触发，经信号在主线程更新界面）
+        self.state_changed_signal.connect(self.on_state_changed)
+        self.voice_chat_system.state.subscribe(lambda old, new: self.state_changed_signal.emit(new))
+        self.on_state_changed(self.voice_chat_system.state.state)
 
         # 初始为圆角矩形（闲置），设置大小
         QTimer.singleShot(100, lambda: self.resize(self.width() or 600, self.idle_height))
 
     def setup_keyboard_listener(self):
-        """设置键盘监听"""
-        self.keyboard_timer = QTimer()
-        self.keyboard_timer.timeout.connect(self.check_keyboard)
-        self.keyboard_timer.start(50)
+        """设置全局热键：钩子回调经信号转到主线程处理，不再轮询按键状态"""
+        self.hotkey_pressed_signal.connect(self.on_hotkey_pressed)
+        self.hotkey_released_signal.connect(self.on_hotkey_released)
+        self.endpoint_signal.connect(self.on_endpoint_reached)
+
+        self.hotkeys = HotkeyListener(config.HOTKEYS, debounce_ms=config.HOTKEY_DEBOUNCE_MS)
+        self.hotkeys.on_press = self.hotkey_pressed_signal.emit
+        self.hotkeys.on_release = self.hotkey_released_signal.emit
+        self.voice_chat_system.speech_recognizer.endpoint_callback = self.endpoint_signal.emit
+        try:
+            self.hotkeys.start()
+        except Exception as e:
+            print(f"键盘监听错误: {e}")
 
     def expand_for_content(self):
         """展开窗口以显示内容"""
@@ -177,81 +199,73 @@ class VoiceChatGUI(QMainWindow):
             pass
 
         # 根据文本内容调整高度
-        self.adjust_window_size()
+        self.schedule_resize()
+
+    def schedule_resize(self):
+        """请求按内容调整窗口大小，同一帧内的多次请求只执行一次"""
+        if not self._resize_timer.isActive():
+            self._resize_timer.start(self.resize_interval_ms)
 
     def collapse_to_strip(self):
         """收缩回长条界面并清理显示内容"""
         # 清空当前响应并隐藏输出框
-        self.current_response = ""
-        # 将状态文本恢复为待机提示并收缩为闲置高度
+        self.has_response = False
+        # 将状态文本恢复为当前状态的提示并收缩为闲置高度
         try:
-            self.status_label.setText("我在的哟，是不是想我啦？")
+            self.status_text.setPlainText(STATUS_MESSAGES[self.voice_chat_system.state.state][1])
         except:
             pass
         self.resize(self.width(), self.idle_height)
 
-    def check_keyboard(self):
-        """检查键盘输入"""
-        try:
-            # 检查空格键按下
-            if keyboard.is_pressed('space') and not self.space_pressed:
-                self.space_pressed = True
-                if (not self.voice_chat_system.speech_recognizer.recording_status and
-                        not self.voice_chat_system.is_processing):
-                    print("空格键按下 - 开始录音")
-                    self.start_recording_signal.emit()
-
-            # 检查空格键释放
-            elif not keyboard.is_pressed('space') and self.space_pressed:
-                self.space_pressed = False
-                if self.voice_chat_system.speech_recognizer.recording_status:
-                    print("空格键释放 - 停止录音")
-                    self.stop_recording_signal.emit()
-
-            # 检查ESC键
-            if keyboard.is_pressed('esc'):
-                self.exit_program_signal.emit()
+    def on_hotkey_pressed(self, action):
+        """热键按下（在主线程中调用）"""
+        if action == "talk":
+            # 回复进行中也可以录音，新问题由轮次调度器排队或打断当前回复
+            if not self.voice_chat_system.speech_recognizer.recording_status:
+                print("录音键按下 - 开始录音")
+                self.start_recording_signal.emit()
+        elif action == "exit":
+            self.exit_program_signal.emit()
 
-        except Exception as e:
-            print(f"键盘监听错误: {e}")
+    def on_hotkey_released(self, action):
+        """热键松开（在主线程中调用），免按住模式下松开不结束录音"""
+        recognizer = self.voice_chat_system.speech_recognizer
+        if action == "talk" and recognizer.recording_status and not recognizer.auto_endpoint:
+            print("录音键松开 - 停止录音")
+            self.stop_recording_signal.emit()
 
-    def update_system_status(self):
-        """更新系统状态显示"""
+    def on_endpoint_reached(self):
+        """免按住模式：检测到说话结束后自动停止录音"""
         if self.voice_chat_system.speech_recognizer.recording_status:
-            # 若正在录音且无正在显示的AI内容，显示录音提示
-            if not self.current_response:
-                self.update_status("recording", "我在听哦")
-            self.recording_indicator.show()
-        elif self.voice_chat_system.is_processing:
-            # 若正在处理且无流式回复，则显示处理提示；否则保留正在显示的流式内容
-            if not self.current_response:
-                self.update_status("processing", "我在处理你的问题啦")
-            self.recording_indicator.hide()
-            try:
-                self.recording_indicator.setFixedWidth(18)
-                self.recording_indicator.setAlignment(Qt.AlignRight | Qt.AlignVCenter)
-            except:
-                pass
-            # 正在处理时保持展开状态
+            print("检测到说话结束 - 停止录音")
+            self.stop_recording_signal.emit()
+
+    def on_state_changed(self, state):
+        """对话状态变化（在主线程中调用），只在变化时更新一次界面"""
+        self.recording_indicator.setVisible(state == RECORDING)
+        if state == GENERATING:
+            # 正在生成时保持展开状态
             self.expand_for_content()
-        else:
-            if not self.current_response:
-                self.update_status("ready", "我在的哟，是不是想我啦？")
-            self.recording_indicator.hide()
-            # 空闲且无内容时收缩为长条
-            if not self.current_response:
+        # 正在显示流式回复时保留回复内容，状态提示等回复收起后再显示
+        if not self.has_response:
+            if state == IDLE:
+                # 空闲且无内容时收缩为长条
                 self.collapse_to_strip()
+            else:
+                self.update_status(*STATUS_MESSAGES[state])
 
     def update_status(self, status_type, message):
         """更新状态显示"""
         icons = {
             "ready": "🌸",
+            "loading": "⏳",
             "recording": "🎤",
             "processing": "🤔",
+            "speaking": "💬",
             "error": "❌"
         }
         # 不再使用单独图标，直接在状态文本中显示信息
-        self.status_label.setText(message)
+        self.status_text.setPlainText(message)
 
     def append_ai_response(self, text, done=False):
         """添加AI回复到输出框并打印到终端"""
@@ -259,14 +273,17 @@ class VoiceChatGUI(QMainWindow):
         try:
             if text:
                 if not done:
-                    # 流式输出：直接追加到状态文本
-                    self.current_response += text
+                    # 流式输出：文本已按显示帧合并，每批只在文档末尾追加一次（终端输出由AIClient完成）
+                    if not self.has_response:
+                        # 回复的第一批文本替换掉状态提示
+                        self.status_text.setPlainText("")
+                        self.has_response = True
+                    cursor = QTextCursor(self.status_text.document())
+                    cursor.movePosition(QTextCursor.End)
+                    cursor.insertText(text)
                     # 确保窗口扩展以显示内容
-                    self.status_label.setText(self.current_response)
                     self.expand_for_content()
-
-                    # 同步打印到终端（不换行，流式显示）
-                    print(text, end="", flush=True)
+                    return
                 else:
                     # 完成输出块
                     if text.strip():
@@ -276,7 +293,7 @@ class VoiceChatGUI(QMainWindow):
 
                     # 生成结束时自动滚动到底部，然后在延迟后收缩并清空当前响应
                     try:
-                        sb = self.scroll_area.verticalScrollBar()
+                        sb = self.status_text.verticalScrollBar()
                         sb.setValue(sb.maximum())
                     except:
                         pass
@@ -287,8 +304,8 @@ class VoiceChatGUI(QMainWindow):
                 if done:
                     print(flush=True)
 
-            # 调整窗口大小（每次收到新内容都动态调整）
-            self.adjust_window_size()
+            # 调整窗口大小
+            self.schedule_resize()
         except Exception as e:
             # 确保 GUI 不会因为打印问题崩溃
             print(f"append_ai_response 错误: {e}")
@@ -296,12 +313,10 @@ class VoiceChatGUI(QMainWindow):
     def adjust_window_size(self):
         """根据内容动态调整窗口高度（仅在输出框可见时）"""
         # 根据状态文本内容动态调整窗口大小
-        text = self.current_response if self.current_response else self.status_label.text()
-
-        # 优先使用 scroll_area 的 viewport 宽度来计算换行宽度，避免与实际显示宽度不一致
+        # 优先使用文本区域 viewport 的宽度来计算换行宽度，避免与实际显示宽度不一致
         max_w = self.maximumWidth()
         try:
-            vp = self.scroll_area.viewport()
+            vp = self.status_text.viewport()
             vpw = vp.width() if vp is not None else 0
         except:
             vpw = 0
@@ -312,38 +327,38 @@ class VoiceChatGUI(QMainWindow):
             # 回退到窗口宽度计算（减去外边距和内边距）
             wrap_width = max(200, self.width() - 60)
 
-        # 使用字体度量计算包装后的文本矩形
-        fm = QFontMetrics(self.status_label.font())
-        rect = fm.boundingRect(0, 0, wrap_width, 10000, Qt.TextWordWrap, text)
+        # 使用字体度量计算包装后的文本尺寸（只测量新增的段落）；
+        # 流式回复已超出展开高度后尺寸不再变化，不必取出整段文本
+        if (self.has_response and wrap_width == self._layout_wrap_width and
+                self._layout_size[1] > self.expanded_max_height):
+            text_width, text_height = self._layout_size
+        else:
+            text_width, text_height = self.measure_text(self.status_text.toPlainText(), wrap_width)
 
         # 计算理想宽度与高度（加上内边距）
-        content_height = rect.height() + 20
-        ideal_width = min(max(rect.width() + 60, 350), max_w)
+        content_height = text_height + 20
+        ideal_width = min(max(text_width + 60, 350), max_w)
 
         # 如果内容高度超出 expanded_max_height，则启用滚动并将窗口高度限制为 expanded_max_height
         if content_height + 40 > self.expanded_max_height:
             ideal_height = self.expanded_max_height
-            # 启用垂直滚动条
-            try:
-                self.scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
-                # 将滚动区域高度设置为窗口内部可用高度
-                self.scroll_area.setMaximumHeight(ideal_height - 40)
-            except:
-                pass
+            scroll_policy = Qt.ScrollBarAsNeeded
         else:
             ideal_height = min(max(content_height + 40, self.idle_height), self.expanded_max_height)
+            scroll_policy = Qt.ScrollBarAlwaysOff
+
+        # 滚动策略与滚动区域高度（窗口内部可用高度）只在变化时设置
+        if self._scroll_state != (scroll_policy, ideal_height, wrap_width):
+            self._scroll_state = (scroll_policy, ideal_height, wrap_width)
             try:
-                self.scroll_area.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-                self.scroll_area.setMaximumHeight(ideal_height - 40)
+                self.status_text.setVerticalScrollBarPolicy(scroll_policy)
+                self.status_text.setMaximumHeight(ideal_height - 40)
             except:
                 pass
 
-        # 设置 label 的最大宽度为实际 wrap_width（加上少量内边距），保证右端贴合
-        try:
-            self.status_label.setMaximumWidth(wrap_width + 4)
-        except:
-            pass
-
+        # 尺寸没有变化时不调整窗口
+        if ideal_width == self.width() and ideal_height == self.height():
+            return
         self.resize(ideal_width, ideal_height)
 
         # 确保窗口不会超出屏幕
@@ -355,6 +370,52 @@ class VoiceChatGUI(QMainWindow):
         if current_geometry.bottom() > screen_geometry.bottom():
             self.move(current_geometry.x(), screen_geometry.bottom() - current_geometry.height())
 
+    def _reset_layout_cache(self, wrap_width):
+        self._layout_wrap_width = wrap_width
+        self._layout_text = ""
+        self._layout_done_length = 0  # 已完整测量的段落（含换行符）的总长度
+        self._layout_done_width = 0
+        self._layout_done_height = 0
+        self._layout_size = (0, 0)
+
+    def measure_text(self, text, wrap_width):
+        """返回文本按wrap_width换行后的(宽, 高)
+
+        流式回复只在末尾追加，已结束的段落尺寸缓存起来，每次只测量新结束的段落和最后一段；
+        已测得的高度超出展开高度后（此时窗口高度固定），继续追加的文本不再测量
+        """
+        if text == self._layout_text and wrap_width == self._layout_wrap_width:
+            return self._layout_size
+        if wrap_width != self._layout_wrap_width or not text.startswith(self._layout_text):
+            self._reset_layout_cache(wrap_width)
+        elif self._layout_size[1] > self.expanded_max_height:
+            # 包括尚未结束的最后一段单独就超出展开高度的情况
+            self._layout_text = text
+            return self._layout_size
+
+        fm = QFontMetrics(self.status_text.font())
+
+        def measure(paragraph):
+            if not paragraph:
+                return 0, fm.lineSpacing()
+            rect = fm.boundingRect(0, 0, wrap_width, 10000, Qt.TextWordWrap, paragraph)
+            return rect.width(), rect.height()
+
+        paragraphs = text[self._layout_done_length:].split("\n")
+        for paragraph in paragraphs[:-1]:
+            width, height = measure(paragraph)
+            self._layout_done_width = max(self._layout_done_width, width)
+            self._layout_done_height += height
+            self._layout_done_length += len(paragraph) + 1
+
+        if self._layout_done_height > self.expanded_max_height:
+            width, height = 0, 0
+        else:
+            width, height = measure(paragraphs[-1])
+        self._layout_text = text
+        self._layout_size = (max(self._layout_done_width, width), self._layout_done_height + height)
+        return self._layout_size
+
     def mousePressEvent(self, event):
         """鼠标按下事件，用于拖动窗口"""
         if event.button() == Qt.LeftButton:
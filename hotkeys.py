@@ -0,0 +1,77 @@
+"""
+全局热键模块
+基于keyboard的钩子回调，按下/松开时立即通知，不再定时轮询按键状态；
+按键名到动作的绑定可配置，按住时的自动重复被忽略，松开后很快又按下（按键抖动）视为一直按住
+"""
+import keyboard
+from threading import Timer, Lock
+
+
+class HotkeyListener:
+    def __init__(self, bindings, debounce_ms=30):
+        """初始化热键监听
+
+        bindings: 动作名 -> 按键名，如 {"talk": "space", "exit": "esc"}
+        debounce_ms: 松开后在该时间内再次按下时忽略这次松开
+        on_press(action) / on_release(action) 在keyboard的钩子线程中调用，应尽快返回
+        """
+        self.bindings = dict(bindings)
+        self.debounce = debounce_ms / 1000
+        self.on_press = None
+        self.on_release = None
+        self._pressed = set()
+        self._release_timers = {}
+        self._hooks = []
+        self._lock = Lock()
+
+    def start(self):
+        for action, key in self.bindings.items():
+            self._hooks.append(keyboard.hook_key(key, lambda event, action=action: self._handle(action, event)))
+
+    def stop(self):
+        for hook in self._hooks:
+            try:
+                keyboard.unhook(hook)
+            except Exception:
+                pass
+        self._hooks = []
+        with self._lock:
+            for timer in self._release_timers.values():
+                timer.cancel()
+            self._release_timers.clear()
+
+    def _handle(self, action, event):
+        if event.event_type == keyboard.KEY_DOWN:
+            with self._lock:
+                timer = self._release_timers.pop(action, None)
+                if timer is not None:
+                    # 抖动：松开还没生效又按下，视为一直按住
+                    timer.cancel()
+                    return
+                if action in self._pressed:
+                    return  # 按住时的自动重复
+                self._pressed.add(action)
+            if self.on_press:
+                self.on_press(action)
+        elif event.event_type == keyboard.KEY_UP:
+            with self._lock:
+                if action not in self._pressed or action in self._release_timers:
+                    return
+                if self.debounce <= 0:
+                    self._pressed.discard(action)
+                else:
+                    timer = Timer(self.debounce, self._release, args=(action,))
+                    timer.daemon = True
+                    self._release_timers[action] = timer
+                    timer.start()
+                    return
+            if self.on_release:
+                self.on_release(action)
+
+    def _release(self, action):
+        with self._lock:
+            if self._release_timers.pop(action, None) is None:
+                return
+            self._pressed.discard(action)
+        if self.on_release:
+            self.on_release(action)
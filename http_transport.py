@@ -0,0 +1,84 @@
+"""
+HTTP传输模块
+Ollama与TTS客户端共用的连接池：保持长连接、统一超时，并提供带抖动的指数退避重试
+"""
+import time
+import random
+import requests
+from threading import Lock
+from requests.adapters import HTTPAdapter
+import config
+
+
+class HTTPTransport:
+    def __init__(self, pool_connections=4, pool_maxsize=8, connect_timeout=3.05, read_timeout=60,
+                 max_retries=2, backoff_base=0.5, backoff_max=8.0):
+        """初始化传输层
+
+        pool_connections: 缓存的主机连接池个数
+        pool_maxsize: 每个主机保持的最大连接数
+        """
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def request(self, method, url, read_timeout=None, **kwargs):
+        """发送请求（复用连接池中的连接），read_timeout为None时使用默认读取超时"""
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        return self.session.request(method, url, timeout=timeout, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def backoff_delay(self, attempt):
+        """第attempt次（从0开始）失败后的等待时间：全抖动指数退避"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request_with_retry(self, method, url, retries=None, retry_statuses=(502, 503, 504), **kwargs):
+        """发送请求，连接失败、超时或网关错误时按指数退避重试"""
+        retries = self.max_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                response = self.request(method, url, **kwargs)
+                if response.status_code not in retry_statuses or attempt == retries:
+                    return response
+                response.close()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == retries:
+                    raise
+            time.sleep(self.backoff_delay(attempt))
+
+    def close(self):
+        self.session.close()
+
+
+_shared_transport = None
+_shared_lock = Lock()
+
+
+def get_transport():
+    """获取全局共享的传输层实例（按配置创建）"""
+    global _shared_transport
+    with _shared_lock:
+        if _shared_transport is None:
+            _shared_transport = HTTPTransport(
+                pool_connections=config.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=config.HTTP_POOL_MAXSIZE,
+                connect_timeout=config.HTTP_CONNECT_TIMEOUT,
+                read_timeout=config.HTTP_READ_TIMEOUT,
+                max_retries=config.HTTP_MAX_RETRIES,
+                backoff_base=config.HTTP_BACKOFF_BASE,
+                backoff_max=config.HTTP_BACKOFF_MAX
+            )
+        return _shared_transport
@@ -0,0 +1,168 @@
+"""
+延迟追踪模块
+记录每轮对话各环节的单调时钟时间点（相对录音结束的毫秒数），整轮结束后写入一行JSONL，
+文件按大小轮转。运行 python latency_trace.py [文件] 输出各阶段耗时的p50/p95/p99
+"""
+import os
+import sys
+import json
+import time
+import logging
+import itertools
+from logging.handlers import RotatingFileHandler
+from threading import Lock
+
+_logger = logging.getLogger("latency_trace")
+_logger.propagate = False
+_logger.setLevel(logging.INFO)
+_turn_ids = itertools.count(1)
+
+# 阶段名, 起点事件, 终点事件
+STAGES = [
+    ("asr_queue", "record_end", "asr_start"),
+    ("asr", "asr_start", "asr_end"),
+    ("turn_queue", "asr_end", "llm_request"),
+    ("llm_first_token", "llm_request", "first_token"),
+    ("llm_generation", "first_token", "last_token"),
+    ("tts_first_byte", "first_sentence", "tts_first_byte"),
+    ("tts_first_sentence", "first_sentence", "first_sentence_synthesized"),
+    ("playback", "playback_start", "playback_end"),
+    ("release_to_first_token", "record_end", "first_token"),
+    ("release_to_audio", "record_end", "playback_start"),
+    ("turn_total", "record_end", "turn_end"),
+]
+
+
+def configure(path, max_bytes=5 * 1024 * 1024, backup_count=3):
+    """开启追踪输出，path为None时不写文件"""
+    for handler in list(_logger.handlers):
+        _logger.removeHandler(handler)
+        handler.close()
+    if path:
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        _logger.addHandler(handler)
+
+
+class TurnTrace:
+    """一轮对话的时间线，起点为录音结束（松开录音键或检测到说话结束）
+
+    参与本轮的各环节用hold()/release()登记，全部结束后记录turn_end并写出
+    """
+
+    def __init__(self):
+        self.turn_id = next(_turn_ids)
+        self.wall_time = time.time()
+        self._origin = time.monotonic()
+        self.events = {"record_end": 0.0}
+        self.fields = {}
+        self._holds = 0
+        self._lock = Lock()
+
+    def mark(self, event, last=False):
+        """记录事件时间；默认只保留第一次，last=True时保留最后一次"""
+        elapsed = round((time.monotonic() - self._origin) * 1000, 1)
+        with self._lock:
+            if last or event not in self.events:
+                self.events[event] = elapsed
+
+    def set(self, **fields):
+        with self._lock:
+            self.fields.update(fields)
+
+    def hold(self):
+        with self._lock:
+            self._holds += 1
+
+    def release(self):
+        with self._lock:
+            self._holds -= 1
+            if self._holds > 0:
+                return
+        self.mark("turn_end")
+        self.write()
+
+    def to_record(self):
+        with self._lock:
+            return {
+                "turn": self.turn_id,
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.wall_time)),
+                "events": dict(self.events),
+                **self.fields
+            }
+
+    def write(self):
+        if _logger.handlers:
+            _logger.info(json.dumps(self.to_record(), ensure_ascii=False))
+
+
+def stage_durations(record):
+    """由事件时间计算各阶段耗时（毫秒），缺少事件的阶段不计入"""
+    events = record.get("events", {})
+    durations = {}
+    for name, start, end in STAGES:
+        if start in events and end in events and events[end] >= events[start]:
+            durations[name] = events[end] - events[start]
+    return durations
+
+
+def percentile(sorted_values, p):
+    """线性插值的百分位数"""
+    position = (len(sorted_values) - 1) * p / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+def load_records(path):
+    """读取追踪文件及其轮转备份（按时间从旧到新）"""
+    paths = [path]
+    index = 1
+    while os.path.exists(f"{path}.{index}"):
+        paths.insert(0, f"{path}.{index}")
+        index += 1
+    records = []
+    for file_path in paths:
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return records
+
+
+def summarize(path):
+    records = load_records(path)
+    if not records:
+        print(f" 没有追踪记录: {path}")
+        return
+
+    samples = {name: [] for name, _, _ in STAGES}
+    for record in records:
+        for name, duration in stage_durations(record).items():
+            samples[name].append(duration)
+
+    print(f" 共 {len(records)} 轮对话（{path}）")
+    print(f"{'阶段':<24}{'次数':>6}{'p50':>10}{'p95':>10}{'p99':>10}  (毫秒)")
+    for name, values in samples.items():
+        if not values:
+            continue
+        values.sort()
+        print(f"{name:<24}{len(values):>6}" +
+              "".join(f"{percentile(values, p):>10.1f}" for p in (50, 95, 99)))
+
+
+def main():
+    if len(sys.argv) > 1:
+        path = sys.argv[1]
+    else:
+        import config
+        path = config.TRACE_FILE
+    summarize(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,10 @@ import nltk
 import sys
 import os
 import time
+from threading import Thread
 from voice_chat_system import VoiceChatSystem
 from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
 
 
 def check_nltk_resources():
@@ -34,9 +36,16 @@ class VoiceChatApp:
     def setup_connections(self):
         """设置信号连接"""
         # 连接GUI信号到聊天系统
-        self.gui.start_recording_signal.connect(self.chat_system.speech_recognizer.start_recording)
+        self.gui.start_recording_signal.connect(self.chat_system.start_recording)
         self.gui.stop_recording_signal.connect(self.stop_recording_and_process)
         self.gui.exit_program_signal.connect(self.exit_program)
+        self.gui.system_ready_signal.connect(self.on_system_ready)
+        # 识别在工作线程中完成，结果在工作线程中直接交给轮次调度器（界面只经信号更新），
+        # 识别状态在问题提交之后才结束，状态不会在识别和生成之间短暂回到空闲
+        self.chat_system.recognition_worker.result_callback = (
+            lambda job_id, text, utterance: self.on_recognition_result(text, utterance.trace,
+                                                                       utterance.wake_word)
+        )
 
         # 设置聊天系统的回调函数到GUI
         # NOTE: 不要直接传入 GUI 的方法（会从工作线程直接调用导致跨线程修改 GUI），
@@ -44,21 +53,62 @@ class VoiceChatApp:
         self.chat_system.set_response_callback(lambda text, done=False: self.gui.ai_response_signal.emit(text, done))
 
     def stop_recording_and_process(self):
-        """停止录音并处理"""
+        """停止录音并提交到识别工作线程（不阻塞界面）"""
         print("停止录音并处理...")
-        user_text = self.chat_system.speech_recognizer.stop_recording_and_recognize()
+        recognizer = self.chat_system.speech_recognizer
+        utterance = recognizer.stop_recording()
+        if utterance is None:
+            self.gui.ai_response_signal.emit("❌ 录音失败，请重试", True)
+            return
+
+        if not recognizer.is_ready:
+            # 模型还在加载，录音在识别队列中等待加载完成
+            self.gui.ai_response_signal.emit("⏳ 我还在醒来，听完马上回答你哦", True)
+
+        self.chat_system.recognition_worker.submit(utterance)
+
+    def on_recognition_result(self, user_text, trace=None, wake_word=False):
+        """处理识别结果（在识别工作线程中调用，不直接操作界面）
+
+        wake_word为True表示录音来自唤醒词监听且以唤醒词开头，只有这种录音需要去掉唤醒词
+        """
+        wake_listener = self.chat_system.wake_listener
+        if wake_word and wake_listener and user_text:
+            user_text = wake_listener.spotter.strip_wake_word(user_text)
         if user_text and len(user_text.strip()) > 0:
             # 先把用户提问显示到界面（使用信号）
             self.gui.ai_response_signal.emit(f"\n🗣️ 您的提问: {user_text}\n", True)
-            self.chat_system.process_ai_response(user_text)
+            self.chat_system.process_ai_response(user_text, trace)
         elif user_text == "":
             self.gui.ai_response_signal.emit("❌ 没有识别到内容，请重新说话", True)
         else:
             self.gui.ai_response_signal.emit("❌ 录音失败，请重试", True)
 
+    def on_system_ready(self, success, message):
+        """后台初始化完成（在主线程中调用）"""
+        if not success:
+            print(f"{message}，程序退出")
+            self.gui.ai_response_signal.emit(f"❌ {message}，程序即将退出", True)
+            QTimer.singleShot(3000, self.exit_program)
+            return
+
+        print("模型与服务已就绪")
+
+        # 唤醒词模式：加载唤醒词模型后开始持续监听
+        if self.chat_system.wake_listener:
+            Thread(target=self.chat_system.wake_listener.start, daemon=True).start()
+
     def exit_program(self):
         """退出程序"""
         print("\n退出程序")
+        if self.chat_system:
+            # 不再需要的回复立即停止，释放Ollama
+            self.chat_system.turn_scheduler.stop()
+            if self.gui:
+                self.gui.hotkeys.stop()
+            self.chat_system.cancel_response()
+            if self.chat_system.wake_listener:
+                self.chat_system.wake_listener.stop()
         if self.app:
             self.app.quit()
 
@@ -66,19 +116,9 @@ class VoiceChatApp:
         """运行应用程序"""
         print("\n" + "=" * 60)
 
-        # 检查NLTK资源
-        check_nltk_resources()
-
-        print("\n" + "=" * 60)
-
-        # 创建语音聊天系统
+        # 创建语音聊天系统（模型在后台加载）
         self.chat_system = VoiceChatSystem(enable_tts=True)
 
-        # 检查服务连接
-        if not self.chat_system.check_services_connection():
-            print("服务连接失败，程序退出")
-            return
-
         print("启动图形界面...")
 
         # 启动GUI
@@ -87,13 +127,19 @@ class VoiceChatApp:
         # 导入GUI类（放在这里避免循环导入）
         from gui import VoiceChatGUI
 
-        # 创建GUI实例
+        # 创建GUI实例，先显示窗口再加载模型
         self.gui = VoiceChatGUI(self.chat_system)
         self.gui.show()
 
         # 设置信号连接
         self.setup_connections()
 
+        # 后台检查NLTK资源、加载识别模型并检查服务连接
+        Thread(target=check_nltk_resources, daemon=True).start()
+        self.chat_system.initialize_async(
+            lambda success, message: self.gui.system_ready_signal.emit(success, message)
+        )
+
         print("程序启动完成！")
         print("使用说明：")
         print("  • 点击麦克风按钮或按住空格键开始录音")
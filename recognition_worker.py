@@ -0,0 +1,66 @@
+"""
+语音识别工作线程模块
+在独立线程中按顺序识别录音，避免阻塞GUI主线程
+"""
+import queue
+import logging
+from threading import Thread, Lock
+
+logger = logging.getLogger(__name__)
+
+
+class RecognitionWorker:
+    def __init__(self, speech_recognizer):
+        """初始化识别工作线程，结果通过result_callback(job_id, text, utterance)返回（在工作线程中调用），
+        utterance为识别的录音（含延迟追踪utterance.trace）
+
+        busy_callback(busy)在开始有任务和任务全部完成时调用；完成通知在result_callback返回之后，
+        result_callback中把问题交给下一环节即可保证状态不会在交接时短暂回到空闲
+        """
+        self.speech_recognizer = speech_recognizer
+        self.result_callback = None
+        self.busy_callback = None
+        self.jobs = queue.Queue()
+        self._next_job_id = 0
+        self._active_jobs = 0
+        self._lock = Lock()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, utterance):
+        """提交一段录音，返回任务编号"""
+        with self._lock:
+            self._next_job_id += 1
+            job_id = self._next_job_id
+            self._active_jobs += 1
+            if self._active_jobs == 1 and self.busy_callback:
+                self.busy_callback(True)
+        self.jobs.put((job_id, utterance))
+        return job_id
+
+    def stop(self):
+        """停止工作线程（排队中的任务会先处理完）"""
+        self.jobs.put((None, None))
+
+    def _run(self):
+        while True:
+            job_id, utterance = self.jobs.get()
+            if job_id is None:
+                break
+
+            try:
+                text = self.speech_recognizer.recognize(utterance)
+            except Exception as e:
+                logger.error(f"识别任务 {job_id} 失败: {e}")
+                text = None
+
+            if self.result_callback:
+                try:
+                    self.result_callback(job_id, text, utterance)
+                except Exception as e:
+                    logger.error(f"识别结果回调出错: {e}")
+
+            with self._lock:
+                self._active_jobs -= 1
+                if self._active_jobs == 0 and self.busy_callback:
+                    self.busy_callback(False)
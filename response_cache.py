@@ -0,0 +1,119 @@
+"""
+回复缓存模块
+常见问候和固定问题直接返回缓存的回复：按归一化后的问题和上下文哈希精确匹配，
+可选按字符n-gram相似度做模糊匹配；条目有过期时间，数量超限时淘汰最久未使用的
+"""
+import re
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+
+def normalize_query(text):
+    """去掉标点与空白并转为小写，使语气和断句不同的同一问题得到相同的键"""
+    return re.sub(r'[^\w]', '', text or "").lower()
+
+
+def char_ngrams(text, n=2):
+    """字符n-gram集合，文本短于n时整体作为一项"""
+    if len(text) < n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def make_context_key(*parts):
+    """把影响回复的上下文（模型、提示词、最近的对话等）压缩成哈希"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheEntry:
+    def __init__(self, response, ngrams, expires_at):
+        self.response = response
+        self.ngrams = ngrams
+        self.expires_at = expires_at
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, ttl=3600, fuzzy_threshold=None, ngram_size=2, max_query_length=50):
+        """初始化回复缓存
+
+        ttl: 条目有效期（秒）
+        fuzzy_threshold: 模糊匹配的相似度阈值（0~1），None表示只做精确匹配
+        max_query_length: 归一化后超过该长度的问题不缓存，长问题几乎不会重复
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.fuzzy_threshold = fuzzy_threshold
+        self.ngram_size = ngram_size
+        self.max_query_length = max_query_length
+        self._entries = OrderedDict()  # (上下文哈希, 归一化问题) -> CacheEntry
+        self._lock = Lock()
+
+    def get(self, query, context_key=""):
+        """查找缓存的回复，未命中返回None"""
+        normalized = normalize_query(query)
+        if not normalized or len(normalized) > self.max_query_length:
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            key = (context_key, normalized)
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._entries.move_to_end(key)
+                    return entry.response
+                del self._entries[key]
+
+            if self.fuzzy_threshold is None:
+                return None
+            return self._fuzzy_lookup(context_key, normalized, now)
+
+    def put(self, query, response, context_key=""):
+        normalized = normalize_query(query)
+        if not normalized or not response or len(normalized) > self.max_query_length:
+            return
+        entry = CacheEntry(response, char_ngrams(normalized, self.ngram_size), time.monotonic() + self.ttl)
+        with self._lock:
+            key = (context_key, normalized)
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _fuzzy_lookup(self, context_key, normalized, now):
+        """在同一上下文的条目中找n-gram相似度（Dice系数）最高且达到阈值的一条"""
+        ngrams = char_ngrams(normalized, self.ngram_size)
+        best_key = None
+        best_score = self.fuzzy_threshold
+        expired = []
+        for key, entry in self._entries.items():
+            if key[0] != context_key:
+                continue
+            if entry.expires_at <= now:
+                expired.append(key)
+                continue
+            # 集合大小相差太多时相似度不可能达到阈值
+            sizes = len(ngrams) + len(entry.ngrams)
+            if 2 * min(len(ngrams), len(entry.ngrams)) < best_score * sizes:
+                continue
+            score = 2 * len(ngrams & entry.ngrams) / sizes
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        for key in expired:
+            del self._entries[key]
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key].response
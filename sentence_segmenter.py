@@ -0,0 +1,66 @@
+"""
+分句模块
+把流式生成的文本按中英文标点切分成句子，供TTS逐句合成
+"""
+import re
+
+# 句末标点：中文句号/感叹号/问号/分号/省略号、英文!?;以及换行
+SENTENCE_END = set("。！？；!?;…\n")
+# 句子过长时可以断开的位置
+SOFT_BREAK = set("，、：,: ")
+# 紧跟在句末标点后、应归入上一句的字符
+CLOSING = set("”’」』）)\"'")
+
+
+class SentenceSegmenter:
+    def __init__(self, min_length=4, max_length=80):
+        """初始化分句器
+
+        min_length: 短于该长度的句子与下一句合并，避免语音过于零碎
+        max_length: 长于该长度仍无句末标点时，在逗号等位置强制断开
+        """
+        self.min_length = min_length
+        self.max_length = max_length
+        self._buffer = []
+        self._length = 0
+        self._pending_boundary = False
+
+    def feed(self, text):
+        """送入一段新生成的文本，返回已完整的句子列表"""
+        sentences = []
+        for char in text:
+            # 句末标点之后出现普通字符时才切分，使连续标点和右引号留在上一句
+            if self._pending_boundary and char not in SENTENCE_END and char not in CLOSING:
+                self._pending_boundary = False
+                if self._length >= self.min_length:
+                    sentences.append(self._take(len(self._buffer)))
+
+            self._buffer.append(char)
+            self._length += 1
+            if char in SENTENCE_END or self._is_english_boundary():
+                self._pending_boundary = True
+            elif self._length >= self.max_length:
+                sentences.append(self._take(self._soft_break_position()))
+        return [sentence for sentence in sentences if sentence]
+
+    def flush(self):
+        """生成结束时取出剩余文本"""
+        self._pending_boundary = False
+        sentence = self._take(len(self._buffer))
+        return [sentence] if sentence else []
+
+    def _is_english_boundary(self):
+        # 英文句点后需要跟空白才算句末，避免切开小数和缩写
+        return len(self._buffer) >= 2 and self._buffer[-1].isspace() and self._buffer[-2] == "."
+
+    def _soft_break_position(self):
+        for index in range(len(self._buffer) - 1, 0, -1):
+            if self._buffer[index] in SOFT_BREAK:
+                return index + 1
+        return len(self._buffer)
+
+    def _take(self, count):
+        sentence = "".join(self._buffer[:count])
+        self._buffer = self._buffer[count:]
+        self._length = len(self._buffer)
+        return re.sub(r'\s+', ' ', sentence).strip()
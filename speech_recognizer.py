@@ -1,38 +1,224 @@
-import warnings
-import whisper
 import sounddevice as sd
 import numpy as np
-import wave
-import os
 import time
-from threading import Lock
+from threading import Lock, Thread, Event
 import logging
+from audio_buffer import AudioBuffer
+from vad import VoiceActivityDetector
+from asr_backends import create_backend
+from latency_trace import TurnTrace
 
 # 设置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
 
-class SpeechRecognizer:
-    def __init__(self, model_size="base"):
-        """初始化语音识别器"""
-        logger.info("初始化Whisper模型...")
+class StreamingTranscriber:
+    """录音期间在后台增量识别，提交稳定前缀，松开按键后只需识别剩余尾部"""
+
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        self.committed_text = ""  # 已确认的识别文本
+        self.committed_samples = 0  # 已确认文本对应的采样点数
+        self.language = None  # 首次识别后固定语言，避免每个窗口重新检测
+        self._previous_segments = []
+        self._stop_event = Event()
+        self._commit_lock = Lock()
+        # 正在进行的窗口识别：{"end": 窗口结束的采样位置, "done": Event, "result": 识别结果}
+        self._inflight = None
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """启动后台识别线程"""
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop_event.wait(self.recognizer.stream_interval):
+            try:
+                self._step()
+            except Exception as e:
+                logger.error(f"增量识别失败: {e}")
+
+    def _step(self):
+        """对未确认部分做一次识别，两次结果一致且远离窗口末尾的分段被确认"""
+        if not self.recognizer.is_ready:
+            return
+        window = self.recognizer.audio_buffer.get_float32(self.committed_samples)
+        # 录音已停止时缓冲区可能已被下一次录音清空，读到的窗口不属于本次录音
+        if self._stop_event.is_set():
+            return
+        sample_rate = self.recognizer.sample_rate
+        if len(window) < sample_rate * self.recognizer.stream_min_window:
+            return
+
+        # 窗口内没有语音时不做识别；只在首次确认之前跳过录音开头的静音，
+        # 之后的窗口从上次确认的分段边界开始，开头紧接着语音，裁剪会丢掉较轻的音节
+        start, end = self.recognizer.vad.trim(window, noise_floor=self.recognizer.endpoint_vad.noise_floor)
+        if end <= start:
+            return
+        if self.committed_samples:
+            start = 0
+        inflight = {"end": self.committed_samples + len(window), "done": Event(), "result": None}
+        window = window[start:]
+        with self._commit_lock:
+            if self._stop_event.is_set():
+                return
+            self._inflight = inflight
+
+        try:
+            result = self.recognizer._transcribe(window, initial_prompt=self.committed_text or None,
+                                                 language=self.language)
+            inflight["result"] = result
+        finally:
+            inflight["done"].set()
+        segments = result.get("segments", [])
+
+        with self._commit_lock:
+            # 停止后不再修改已确认状态，尾部识别以停止时的状态为准（进行中的结果留给finish复用）
+            if self._stop_event.is_set():
+                return
+            self._inflight = None
+            self._commit(result, segments, start, len(window))
+
+    def _commit(self, result, segments, start, window_length):
+        """确认本次识别中稳定的分段（调用方持有_commit_lock）"""
+        if self.language is None:
+            self.language = result.get("language")
+        sample_rate = self.recognizer.sample_rate
+
+        # 局部一致性：与上一次识别结果相同、且结束时间不在窗口末尾的分段视为稳定
+        window_seconds = window_length / sample_rate
+        stable = []
+        for previous, current in zip(self._previous_segments, segments):
+            if previous["text"].strip() != current["text"].strip():
+                break
+            if current["end"] > window_seconds - self.recognizer.stream_margin:
+                break
+            stable.append(current)
+
+        if stable:
+            self.committed_text += "".join(segment["text"] for segment in stable)
+            self.committed_samples += start + int(stable[-1]["end"] * sample_rate)
+            logger.info(f"已确认文本: {self.committed_text.strip()}")
+            if self.recognizer.partial_callback:
+                try:
+                    self.recognizer.partial_callback(self.committed_text.strip())
+                except Exception as e:
+                    logger.error(f"部分结果回调出错: {e}")
+
+        # 剩余分段的起点即为下一个窗口的起点
+        self._previous_segments = segments[len(stable):]
 
-        # 抑制Whisper的警告
-        with warnings.catch_warnings():
-            warnings.simplefilter("ignore")
-            self.model = whisper.load_model(model_size)
+    def stop(self):
+        """停止增量识别（录音结束时调用），之后不再读取共享的录音缓冲区"""
+        with self._commit_lock:
+            self._stop_event.set()
 
-        logger.info(f"Whisper {model_size} 模型加载完成")
+    def cancel(self):
+        """停止后台识别，丢弃结果"""
+        self.stop()
+
+    def finish(self, full_audio, noise_floor=None):
+        """只识别未确认的尾部并返回完整文本；full_audio为停止录音时冻结的完整音频，
+        noise_floor为录音时测得的噪声基底
+
+        不等待后台线程退出：录音结束时正在进行的窗口识别若已覆盖全部语音（之后只有静音），
+        直接使用它的结果，不再重新识别尾部
+        """
+        self.stop()
+        inflight = self._inflight
+        if inflight is not None:
+            start, end = self.recognizer.vad.trim(full_audio[inflight["end"]:], noise_floor=noise_floor)
+            if end <= start:
+                inflight["done"].wait()
+                if inflight["result"] is not None:
+                    logger.info("复用进行中的窗口识别结果")
+                    return (self.committed_text + inflight["result"]["text"]).strip()
+
+        # 尾部紧接着已确认的语音，只裁剪末尾的静音（尚未确认任何文本时开头也可能是静音）
+        tail = full_audio[self.committed_samples:]
+        start, end = self.recognizer.vad.trim(tail, noise_floor=noise_floor)
+        if end <= start:
+            tail = tail[:0]
+        else:
+            tail = tail[0 if self.committed_samples else start:end]
+        tail_text = ""
+        if len(tail) >= self.recognizer.sample_rate * 0.2:
+            result = self.recognizer._transcribe(tail, initial_prompt=self.committed_text or None,
+                                                 language=self.language)
+            tail_text = result["text"]
+        logger.info(f"尾部识别时长: {len(tail) / self.recognizer.sample_rate:.2f}秒")
+        return (self.committed_text + tail_text).strip()
+
+
+class Utterance:
+    """一次录音：完整音频及其流式识别状态"""
+
+    def __init__(self, audio, sample_rate=16000, transcriber=None, trace=None, wake_word=False,
+                 noise_floor=None):
+        self.audio = audio
+        self.sample_rate = sample_rate
+        self.transcriber = transcriber
+        # 录音时在静音上测得的噪声基底，裁剪静音时使用；None表示由VAD自行估计
+        self.noise_floor = noise_floor
+        # 由唤醒词监听产生且以唤醒词开头，识别文本需去掉开头的唤醒词
+        self.wake_word = wake_word
+        # 本轮对话的延迟追踪，从录音结束开始计时
+        self.trace = trace or TurnTrace()
+        self.trace.set(audio_duration=round(self.duration, 2))
+
+    @property
+    def duration(self):
+        """录音时长（秒）"""
+        return len(self.audio) / self.sample_rate
+
+
+class SpeechRecognizer:
+    def __init__(self, model_size="base", backend="whisper", device=None, compute_type="int8",
+                 streaming=False, stream_interval=1.0,
+                 auto_endpoint=False, endpoint_silence=0.8, no_speech_timeout=8.0):
+        """初始化语音识别器
+
+        backend为识别后端名称（见asr_backends.create_backend），compute_type仅对faster-whisper生效；
+        streaming为True时，录音期间在后台每隔stream_interval秒增量识别一次；
+        auto_endpoint为True时为免按住模式，说完后静音endpoint_silence秒自动结束录音
+        """
+        # 模型由load_model加载（可在后台线程中进行），加载完成前可以录音
+        self.model_size = model_size
+        self.backend_name = backend
+        self.device = device
+        self.compute_type = compute_type
+        self.backend = None
+        self.model_ready = Event()
 
         # 音频参数
         self.sample_rate = 16000
         self.is_recording = False
-        self.audio_data = []
-        self.temp_file = "temp_audio.wav"
+        self.blocksize = 1024
+        self.audio_buffer = AudioBuffer(self.sample_rate)
+        self.stream = None
         self.recording_lock = Lock()
         self.last_recognition_time = 0  # 防止频繁识别
 
+        # 流式识别参数
+        self.streaming = streaming
+        self.stream_interval = stream_interval
+        self.stream_min_window = 1.0  # 窗口不足该秒数时不识别
+        self.stream_margin = 1.0  # 结束时间距窗口末尾小于该秒数的分段不确认
+        self.model_lock = Lock()  # 识别模型不支持并发调用
+        self.partial_callback = None  # 已确认文本更新时的回调
+        self.transcriber = None
+
+        # 语音活动检测：识别前裁剪静音，免按住模式下检测说话结束
+        self.vad = VoiceActivityDetector(self.sample_rate)
+        self.endpoint_vad = VoiceActivityDetector(self.sample_rate)
+        self.auto_endpoint = auto_endpoint
+        self.endpoint_silence = endpoint_silence
+        self.no_speech_timeout = no_speech_timeout
+        self.endpoint_callback = None  # 免按住模式下检测到说话结束时调用（在音频回调线程中，每次录音一次）
+        self.recording_callback = None  # 录音开始/结束时调用recording_callback(is_recording)
+        self._endpoint_notified = False
+
     def start_recording(self):
         """开始录音"""
         with self.recording_lock:
@@ -48,93 +234,178 @@ class SpeechRecognizer:
 
             logger.info("开始录音...（松开空格键停止）")
             self.is_recording = True
-            self.audio_data = []
+            self.audio_buffer.clear()
+            self.endpoint_vad.reset()
+            self._endpoint_notified = False
 
             def audio_callback(indata, frames, time, status):
                 if self.is_recording and status:
                     logger.warning(f"音频流状态: {status}")
                 if self.is_recording:
-                    self.audio_data.append(indata.copy())
+                    self.audio_buffer.append(indata)
+                    # 始终跟踪噪声基底，识别前裁剪静音时以它为准
+                    self.endpoint_vad.process(indata)
+                    if self.auto_endpoint:
+                        if (self.endpoint_callback and not self._endpoint_notified and
+                                self.endpoint_reached):
+                            self._endpoint_notified = True
+                            self.endpoint_callback()
 
             try:
                 self.stream = sd.InputStream(
                     samplerate=self.sample_rate,
                     channels=1,
                     callback=audio_callback,
-                    blocksize=1024,
+                    blocksize=self.blocksize,
                     dtype=np.int16
                 )
                 self.stream.start()
                 logger.info("录音开始成功")
+                if self.recording_callback:
+                    self.recording_callback(True)
+
+                if self.streaming:
+                    self.transcriber = StreamingTranscriber(self)
+                    self.transcriber.start()
             except Exception as e:
                 logger.error(f"录音设备初始化失败: {e}")
                 self.is_recording = False
 
-    def stop_recording_and_recognize(self):
-        """停止录音并进行识别"""
+    def load_model(self):
+        """加载识别模型，并用一段静音预热，避免首次识别承担延迟初始化的开销"""
+        if self.model_ready.is_set():
+            return
+        logger.info(f"初始化识别后端 {self.backend_name}...")
+        start_time = time.time()
+        self.backend = create_backend(self.backend_name, self.model_size, device=self.device,
+                                      compute_type=self.compute_type)
+        logger.info(f"{self.backend.name} {self.model_size} 模型加载完成，用时 {time.time() - start_time:.1f}秒")
+
+        try:
+            with self.model_lock:
+                self.backend.transcribe(np.zeros(self.sample_rate, dtype=np.float32))
+            logger.info("模型预热完成")
+        except Exception as e:
+            logger.warning(f"模型预热失败: {e}")
+        self.model_ready.set()
+
+    @property
+    def is_ready(self):
+        """识别模型是否已加载完成"""
+        return self.model_ready.is_set()
+
+    def stop_recording(self):
+        """停止录音，返回待识别的录音片段；录音过短时返回None"""
         with self.recording_lock:
             if not self.is_recording:
                 logger.warning("当前没有在录音")
                 return None
 
+            transcriber, self.transcriber = self.transcriber, None
+            if transcriber:
+                # 先停止增量识别，之后的识别只使用Utterance中冻结的音频
+                transcriber.stop()
+            self.is_recording = False
+            self._stop_stream()
+            if self.recording_callback:
+                self.recording_callback(False)
+
             # 检查录音时长
-            if len(self.audio_data) < 10:  # 至少10个数据块（约0.5秒）
+            if len(self.audio_buffer) < self.blocksize * 10:  # 至少10个数据块（约0.5秒）
                 logger.warning("录音时间太短")
-                self.is_recording = False
+                if transcriber:
+                    transcriber.cancel()
                 return None
 
-            logger.info("停止录音，正在识别...")
-            self.is_recording = False
-
-            try:
-                if self.stream:
-                    self.stream.stop()
-                    self.stream.close()
-            except Exception as e:
-                logger.error(f"停止流时出错: {e}")
-
-            try:
-                full_audio = np.concatenate(self.audio_data, axis=0)
+            logger.info("停止录音")
+            return Utterance(self.audio_buffer.get_float32(), self.sample_rate, transcriber,
+                             noise_floor=self.endpoint_vad.noise_floor)
 
-                # 检查音频数据是否有效
-                if len(full_audio) < self.sample_rate * 0.5:  # 至少0.5秒
-                    logger.warning("音频数据过短")
-                    return None
+    def recognize(self, utterance):
+        """识别录音片段，返回识别文本；没有语音时返回空字符串，失败时返回None"""
+        utterance.trace.mark("asr_start")
+        try:
+            return self._recognize(utterance)
+        finally:
+            utterance.trace.mark("asr_end")
 
-                self._save_audio_to_file(full_audio)
+    def _recognize(self, utterance):
+        transcriber = utterance.transcriber
+        full_audio = utterance.audio
+        try:
+            # 检查音频数据是否有效
+            if len(full_audio) < self.sample_rate * 0.5:  # 至少0.5秒
+                logger.warning("音频数据过短")
+                if transcriber:
+                    transcriber.cancel()
+                return None
 
-                # 使用Whisper识别
-                logger.info("开始语音识别...")
-                with warnings.catch_warnings():
-                    warnings.simplefilter("ignore")
-                    result = self.model.transcribe(self.temp_file)
-                text = result["text"].strip()
+            if not self.is_ready:
+                logger.info("等待识别模型加载...")
+                self.model_ready.wait()
 
+            if transcriber:
+                # 流式模式：稳定前缀已在录音期间识别，这里只识别尾部
+                logger.info("开始识别未确认的尾部...")
+                text = transcriber.finish(full_audio, utterance.noise_floor)
                 logger.info(f"识别结果: {text}")
+                self.last_recognition_time = time.time()
+                return text
 
-                # 更新最后识别时间
+            # 裁剪首尾静音，减少送入模型的采样数
+            start, end = self.vad.trim(full_audio, noise_floor=utterance.noise_floor)
+            if end <= start:
+                logger.info("未检测到语音")
                 self.last_recognition_time = time.time()
+                return ""
+            full_audio = full_audio[start:end]
+            logger.info(f"裁剪静音后时长: {len(full_audio) / self.sample_rate:.2f}秒")
 
-                # 清理临时文件
-                if os.path.exists(self.temp_file):
-                    os.remove(self.temp_file)
+            # 直接将内存中的音频送入识别模型
+            logger.info("开始语音识别...")
+            result = self._transcribe(full_audio)
+            text = result["text"].strip()
 
-                return text
-            except Exception as e:
-                logger.error(f"语音识别失败: {e}")
-                return None
+            logger.info(f"识别结果: {text}")
+
+            # 更新最后识别时间
+            self.last_recognition_time = time.time()
 
-    def _save_audio_to_file(self, audio_data):
-        """保存音频数据到文件"""
+            return text
+        except Exception as e:
+            logger.error(f"语音识别失败: {e}")
+            return None
+
+    def stop_recording_and_recognize(self):
+        """停止录音并进行识别"""
+        utterance = self.stop_recording()
+        if utterance is None:
+            return None
+        return self.recognize(utterance)
+
+    def _stop_stream(self):
+        """停止并关闭录音流"""
         try:
-            with wave.open(self.temp_file, 'wb') as wf:
-                wf.setnchannels(1)
-                wf.setsampwidth(2)
-                wf.setframerate(self.sample_rate)
-                wf.writeframes(audio_data.tobytes())
-            logger.info(f"音频文件保存成功，大小: {len(audio_data)} 采样点")
+            if self.stream:
+                self.stream.stop()
+                self.stream.close()
         except Exception as e:
-            logger.error(f"保存音频文件失败: {e}")
+            logger.error(f"停止流时出错: {e}")
+
+    def _transcribe(self, audio, initial_prompt=None, language=None):
+        """识别float32音频数组，模型调用串行化"""
+        with self.model_lock:
+            return self.backend.transcribe(audio, initial_prompt=initial_prompt, language=language)
+
+    @property
+    def endpoint_reached(self):
+        """免按住模式下是否应结束录音：说话后静音足够久，或长时间没有说话"""
+        if not self.auto_endpoint or not self.is_recording:
+            return False
+        vad = self.endpoint_vad
+        if vad.speech_detected:
+            return vad.trailing_silence >= self.endpoint_silence
+        return vad.elapsed >= self.no_speech_timeout
 
     @property
     def recording_status(self):
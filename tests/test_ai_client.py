@@ -0,0 +1,115 @@
+"""
+AsyncAIClient的取消测试：用本机的假Ollama流式服务代替真实服务
+"""
+import os
+import sys
+import json
+import asyncio
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ai_client import AsyncAIClient, OllamaError  # noqa: E402
+
+TOTAL_CHUNKS = 50
+
+
+async def start_fake_ollama(state, status=200):
+    """启动假的流式对话接口：每隔10毫秒写出一行JSON，记录写出的行数与连接是否被断开"""
+
+    async def handle_chat(request):
+        await request.json()
+        response = web.StreamResponse(status=status)
+        await response.prepare(request)
+        if status != 200:
+            return response
+        try:
+            for index in range(TOTAL_CHUNKS):
+                line = {"message": {"content": f"{index},"}, "done": index == TOTAL_CHUNKS - 1}
+                await response.write(json.dumps(line).encode("utf-8") + b"\n")
+                state["sent"] += 1
+                await asyncio.sleep(0.01)
+        except (ConnectionResetError, asyncio.CancelledError):
+            state["disconnected"] = True
+            raise
+        return response
+
+    app = web.Application()
+    app.router.add_post("/api/chat", handle_chat)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/api/chat"
+
+
+def test_stream_completes():
+    async def run():
+        state = {"sent": 0, "disconnected": False}
+        runner, url = await start_fake_ollama(state)
+        client = AsyncAIClient(url, "test")
+        try:
+            return [content async for content in client.stream_chat([])]
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    parts = asyncio.run(run())
+    assert len(parts) == TOTAL_CHUNKS
+
+
+def test_cancel_closes_stream():
+    async def run():
+        state = {"sent": 0, "disconnected": False}
+        runner, url = await start_fake_ollama(state)
+        client = AsyncAIClient(url, "test")
+        received = []
+
+        async def consume():
+            async for content in client.stream_chat([]):
+                received.append(content)
+                if len(received) == 10:
+                    task.cancel()
+
+        task = asyncio.ensure_future(consume())
+        try:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            # 给服务端一点时间发现连接已断开
+            for _ in range(50):
+                if state["disconnected"]:
+                    break
+                await asyncio.sleep(0.01)
+            return received, state
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    received, state = asyncio.run(run())
+    assert len(received) == 10
+    assert state["disconnected"]
+    assert state["sent"] < TOTAL_CHUNKS
+
+
+def test_error_status():
+    async def run():
+        state = {"sent": 0, "disconnected": False}
+        runner, url = await start_fake_ollama(state, status=500)
+        client = AsyncAIClient(url, "test")
+        try:
+            async for _ in client.stream_chat([]):
+                pass
+        finally:
+            await client.close()
+            await runner.cleanup()
+
+    try:
+        asyncio.run(run())
+    except OllamaError as e:
+        assert e.status_code == 500
+    else:
+        raise AssertionError("应抛出OllamaError")
@@ -0,0 +1,54 @@
+"""
+流式文本合并模块
+生成速度很快时每个token一次界面更新会占满Qt事件循环；这里把同一显示帧内到达的token
+合并成一段再发出，两次发出之间至少间隔一帧
+"""
+import time
+from threading import Thread, Condition, Lock
+
+
+class TokenCoalescer:
+    def __init__(self, emit, interval=0.025):
+        """emit(text)在后台线程中调用；interval为两次发出之间的最小间隔（秒），约为一帧"""
+        self.emit = emit
+        self.interval = interval
+        self._parts = []
+        self._last_emit = 0.0
+        self._condition = Condition()
+        self._emit_lock = Lock()  # 保证后台发出与flush之间的顺序
+        Thread(target=self._run, daemon=True).start()
+
+    def push(self, text):
+        """加入一段新文本"""
+        if not text:
+            return
+        with self._condition:
+            self._parts.append(text)
+            self._condition.notify()
+
+    def flush(self):
+        """立即发出尚未发出的文本（生成结束时调用），返回发出的文本"""
+        with self._emit_lock:
+            return self._emit_pending()
+
+    def _emit_pending(self):
+        with self._condition:
+            text = "".join(self._parts)
+            self._parts.clear()
+        if text:
+            self.emit(text)
+            self._last_emit = time.monotonic()
+        return text
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._parts:
+                    self._condition.wait()
+                # 距上次发出不足一帧时等到下一帧，期间到达的token一起发出
+                remaining = self._last_emit + self.interval - time.monotonic()
+                while remaining > 0:
+                    self._condition.wait(remaining)
+                    remaining = self._last_emit + self.interval - time.monotonic()
+            with self._emit_lock:
+                self._emit_pending()
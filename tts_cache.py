@@ -0,0 +1,163 @@
+"""
+TTS音频缓存模块
+两级缓存：内存LRU（按字节数限制）+ 磁盘存储（按字节数限制，优先淘汰最久未使用的文件），
+键为文本与语音参数的哈希
+"""
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+from threading import Lock
+
+
+class TTSCache:
+    def __init__(self, cache_dir="tts_cache", max_memory_bytes=32 * 1024 * 1024,
+                 max_disk_bytes=256 * 1024 * 1024):
+        """初始化缓存，cache_dir为None时只使用内存缓存；max_disk_bytes为None时磁盘缓存不设上限"""
+        self.cache_dir = cache_dir
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = Lock()
+        # 磁盘文件索引：键 -> 文件字节数，按最近使用时间从旧到新排列
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._disk_lock = Lock()
+
+        if self.cache_dir:
+            try:
+                os.makedirs(self.cache_dir, exist_ok=True)
+                self._scan_disk()
+            except Exception as e:
+                print(f" 无法创建TTS缓存目录: {e}")
+                self.cache_dir = None
+
+    def _scan_disk(self):
+        """启动时按文件修改时间建立磁盘索引，并淘汰超出预算的部分"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".wav"):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        entries.sort()
+        with self._disk_lock:
+            for _, key, size in entries:
+                self._disk[key] = size
+                self._disk_bytes += size
+        self._evict_disk()
+
+    @staticmethod
+    def make_key(text, **params):
+        """根据清理后的文本和语音参数生成缓存键"""
+        payload = json.dumps([text, params], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".wav")
+
+    def get(self, key):
+        """查找缓存的音频数据，未命中返回None"""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+
+        if not self.cache_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f" 读取TTS缓存失败: {e}")
+            return None
+
+        self._touch_disk(key, path, len(data))
+        self._put_memory(key, data)
+        return data
+
+    def put(self, key, data):
+        """写入缓存（内存与磁盘）"""
+        self._put_memory(key, data)
+        if not self.cache_dir:
+            return
+        path = self._path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            # 先写临时文件再替换，避免其他进程读到写了一半的文件
+            os.replace(temp_path, path)
+        except Exception as e:
+            print(f" 写入TTS缓存失败: {e}")
+            try:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            except:
+                pass
+            return
+        self._touch_disk(key, None, len(data))
+        self._evict_disk()
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._memory:
+                return True
+        return bool(self.cache_dir) and os.path.exists(self._path(key))
+
+    def _touch_disk(self, key, path, size):
+        """把磁盘条目标记为最近使用；path不为None时同时更新文件时间，供下次启动时排序"""
+        with self._disk_lock:
+            old = self._disk.pop(key, None)
+            if old is not None:
+                self._disk_bytes -= old
+            self._disk[key] = size
+            self._disk_bytes += size
+        if path:
+            try:
+                now = time.time()
+                os.utime(path, (now, now))
+            except OSError:
+                pass
+
+    def _evict_disk(self):
+        """超出磁盘字节预算时删除最久未使用的文件"""
+        if self.max_disk_bytes is None:
+            return
+        while True:
+            with self._disk_lock:
+                if self._disk_bytes <= self.max_disk_bytes or not self._disk:
+                    return
+                key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f" 清理TTS缓存失败: {e}")
+
+    def _put_memory(self, key, data):
+        if len(data) > self.max_memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= len(old)
+            self._memory[key] = data
+            self._memory_bytes += len(data)
+            # 超出字节预算时淘汰最久未使用的条目
+            while self._memory_bytes > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
@@ -1,29 +1,43 @@
 import requests
-import pygame
+import sounddevice as sd
 import time
-import os
 import re
-from threading import Lock
-
-
-class TTSService:
-    def __init__(self, tts_url="http://127.0.0.1:9880"):
-        """初始化TTS服务"""
+import queue
+import itertools
+from threading import Lock, Thread, Event
+from tts_cache import TTSCache
+from audio_player import AudioPlayer, ChunkStream
+from http_transport import get_transport
+from sentence_segmenter import SentenceSegmenter
+
+
+class TTSSynthesizer:
+    """语音合成（HTTP请求与两级缓存），不涉及音频输出，可在无声卡的服务中单独使用"""
+
+    # 经常播报的固定语句，启动时在后台预先合成
+    COMMON_PHRASES = [
+        "我没有听清楚您说的话，请再说一遍。",
+        "抱歉，AI服务暂时不可用。",
+        "处理请求时出现错误。",
+        "测试",
+    ]
+
+    def __init__(self, tts_url="http://127.0.0.1:9880", text_language="zh", cache_dir="tts_cache",
+                 cache_memory_bytes=32 * 1024 * 1024, cache_disk_bytes=256 * 1024 * 1024, transport=None):
+        """初始化语音合成
+
+        cache_dir为None时只在内存中缓存合成结果，cache_disk_bytes为磁盘缓存的字节上限；
+        transport默认使用共享的HTTP连接池
+        """
         self.tts_url = tts_url
+        self.transport = transport or get_transport()
+        self.text_language = text_language
         self.tts_enabled = True
-        self.tts_lock = Lock()
-
-        # 初始化pygame混音器
-        try:
-            pygame.mixer.init(frequency=22050, size=-16, channels=1, buffer=512)
-            print(" 音频输出系统初始化完成")
-        except Exception as e:
-            print(f" 音频输出系统初始化失败: {e}")
-            self.tts_enabled = False
+        self.cache = TTSCache(cache_dir, cache_memory_bytes, cache_disk_bytes)
 
-    def clean_text_for_tts(self, text):
+    def clean_text_for_tts(self, text, max_length=150):
         """
-        清理文本，确保只包含中文和基本标点
+        清理文本，确保只包含中文和基本标点；max_length为None时不截断
         """
         if not text:
             return "抱歉，这段内容无法转换为语音"
@@ -43,136 +57,146 @@ class TTSService:
             return "抱歉，这段内容无法转换为语音"
 
         # 限制文本长度
-        if len(cleaned_text) > 150:
-            cleaned_text = cleaned_text[:150] + "。"
+        if max_length and len(cleaned_text) > max_length:
+            cleaned_text = cleaned_text[:max_length] + "。"
 
         return cleaned_text
 
-    def text_to_speech(self, text, max_retries=2):
-        """TTS函数，带线程锁防止并发冲突"""
-        if not self.tts_enabled or not text:
-            return False
-
-        # 使用锁防止多个线程同时访问TTS
-        with self.tts_lock:
-            return self._text_to_speech_impl(text, max_retries)
-
-    def _text_to_speech_impl(self, text, max_retries=2):
-        """TTS实现"""
-        try:
-            # 基础文本清理
-            cleaned_text = self.clean_text_for_tts(text)
-            if not cleaned_text or cleaned_text == "抱歉，这段内容无法转换为语音":
-                print(" 文本清理后为空，跳过TTS")
-                return False
+    def cache_key(self, cleaned_text):
+        """缓存键包含文本、语言和服务地址（不同服务可能使用不同音色）"""
+        return TTSCache.make_key(cleaned_text, text_language=self.text_language, tts_url=self.tts_url)
 
-            print(f" TTS文本: {cleaned_text}")
+    def synthesize_stream(self, cleaned_text, max_retries=2, is_cancelled=None, on_response=None):
+        """合成语音，按到达顺序逐块产出WAV字节；优先使用缓存，完整下载后写入缓存
 
-            for attempt in range(max_retries):
+        is_cancelled返回True时停止请求；on_response(response)在请求发出后调用，便于其他线程中止请求
+        """
+        key = self.cache_key(cleaned_text)
+        audio_content = self.cache.get(key)
+        if audio_content is not None:
+            print(f" TTS缓存命中: {cleaned_text}")
+            yield audio_content
+            return
+
+        chunks = []
+        stream = self._request_tts_stream(cleaned_text, max_retries, is_cancelled, on_response)
+        while True:
+            try:
+                chunk = next(stream)
+            except StopIteration as stop:
+                complete = stop.value
+                break
+            chunks.append(chunk)
+            yield chunk
+
+        # 只缓存完整下载的音频
+        if complete:
+            self.cache.put(key, b"".join(chunks))
+
+    def synthesize(self, cleaned_text, max_retries=2):
+        """合成语音，返回完整的WAV音频数据，失败返回None"""
+        audio_content = b"".join(self.synthesize_stream(cleaned_text, max_retries))
+        if len(audio_content) < 2048:
+            return None
+        return audio_content
+
+    def prewarm(self, phrases=None):
+        """在后台预先合成固定语句，之后播报时直接命中缓存"""
+
+        def run():
+            for phrase in phrases or self.COMMON_PHRASES:
+                cleaned_text = self.clean_text_for_tts(phrase)
+                if self.cache_key(cleaned_text) in self.cache:
+                    continue
                 try:
-                    # 使用GET请求，参数尽量简单
-                    params = {
-                        "text": cleaned_text,
-                        "text_language": "zh"
-                    }
-
-                    print(f" 尝试生成语音 (第 {attempt + 1} 次)...")
-
-                    response = requests.get(
-                        self.tts_url,
-                        params=params,
-                        timeout=45,  # 延长超时时间
-                        stream=True
-                    )
-
-                    if response.status_code == 200:
-                        # 收集音频数据
-                        audio_content = b""
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                audio_content += chunk
-
-                        # 检查响应内容是否有效
-                        if len(audio_content) < 2048:  # 提高最小长度要求
-                            print(f" 响应内容过短: {len(audio_content)} 字节")
-                            continue
-
-                        # 保存到临时文件
-                        temp_audio_file = f"temp_tts_{int(time.time())}.wav"
-                        try:
-                            with open(temp_audio_file, 'wb') as f:
-                                f.write(audio_content)
-
-                            # 验证文件是否可读
-                            if os.path.getsize(temp_audio_file) < 2048:
-                                print(" 音频文件过小")
-                                continue
-
-                            # 播放音频
-                            if not pygame.mixer.get_init():
-                                pygame.mixer.init()
-
-                            pygame.mixer.music.load(temp_audio_file)
-                            pygame.mixer.music.play()
-
-                            print(" 播放音频中...")
-
-                            # 等待播放完成
-                            start_time = time.time()
-                            while pygame.mixer.music.get_busy():
-                                if time.time() - start_time > 60:  # 延长超时
-                                    print(" 音频播放超时")
-                                    pygame.mixer.music.stop()
-                                    break
-                                time.sleep(0.1)
-
-                            print(" 音频播放完成")
-                            return True
-
-                        except Exception as e:
-                            print(f" 文件操作失败: {e}")
-                        finally:
-                            # 清理临时文件
-                            try:
-                                if os.path.exists(temp_audio_file):
-                                    os.remove(temp_audio_file)
-                            except:
-                                pass
-
-                    else:
-                        print(f" TTS请求失败，状态码: {response.status_code}")
-
-                except requests.exceptions.ConnectionError:
-                    print(f" 无法连接到TTS服务 (第 {attempt + 1} 次尝试)")
-                except requests.exceptions.Timeout:
-                    print(f" TTS请求超时 (第 {attempt + 1} 次尝试)")
+                    self.synthesize(cleaned_text, max_retries=1)
                 except Exception as e:
-                    print(f" TTS错误 (第 {attempt + 1} 次): {e}")
+                    print(f" 预合成失败: {e}")
 
-                # 重试前等待
-                if attempt < max_retries - 1:
-                    time.sleep(3)  # 增加等待时间
+        if self.tts_enabled:
+            Thread(target=run, daemon=True).start()
 
-            print(" 所有重试均失败")
-            return False
+    def _request_tts_stream(self, cleaned_text, max_retries=2, is_cancelled=None, on_response=None):
+        """请求TTS服务合成语音，逐块产出响应数据，完整接收时返回True；开始产出数据后不再重试"""
+        print(f" TTS文本: {cleaned_text}")
 
-        except Exception as e:
-            print(f" TTS处理过程中发生错误: {e}")
-            return False
+        for attempt in range(max_retries):
+            if is_cancelled and is_cancelled():
+                return False
+            received = 0
+            response = None
+            try:
+                # 使用GET请求，参数尽量简单
+                params = {
+                    "text": cleaned_text,
+                    "text_language": self.text_language
+                }
+
+                print(f" 尝试生成语音 (第 {attempt + 1} 次)...")
+
+                response = self.transport.get(
+                    self.tts_url,
+                    params=params,
+                    read_timeout=45,  # 延长超时时间
+                    stream=True
+                )
+                if on_response:
+                    on_response(response)
+
+                if response.status_code == 200:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            received += len(chunk)
+                            yield chunk
+
+                    # 检查响应内容是否有效
+                    if received >= 2048:  # 提高最小长度要求
+                        return True
+                    print(f" 响应内容过短: {received} 字节")
+                    if received:
+                        return False
+                else:
+                    print(f" TTS请求失败，状态码: {response.status_code}")
+
+            except requests.exceptions.ConnectionError:
+                print(f" 无法连接到TTS服务 (第 {attempt + 1} 次尝试)")
+            except requests.exceptions.Timeout:
+                print(f" TTS请求超时 (第 {attempt + 1} 次尝试)")
+            except Exception as e:
+                if is_cancelled and is_cancelled():
+                    print(" TTS请求已中止")
+                    return False
+                print(f" TTS错误 (第 {attempt + 1} 次): {e}")
+            finally:
+                if response is not None:
+                    response.close()
+
+            # 已经播放了一部分，无法重试
+            if received:
+                print(" 音频流中断")
+                return False
+
+            # 重试前按指数退避等待
+            if attempt < max_retries - 1:
+                time.sleep(self.transport.backoff_delay(attempt))
+
+        print(" 所有重试均失败")
+        return False
 
     def check_connection(self):
         """检查TTS服务连接"""
         if not self.tts_enabled:
             return True
 
+        test_text = "测试"
         try:
-            test_text = "测试"
-            params = {
-                "text": test_text,
-                "text_language": "zh"
-            }
-            response = requests.get(self.tts_url, params=params, timeout=15)
-            if response.status_code == 200:
+            if self.cache_key(test_text) in self.cache:
+                # 探测语音已缓存：只确认服务可达，不再让TTS服务器重新合成
+                self.transport.get(self.tts_url, read_timeout=5).close()
+                print(" TTS服务连接正常")
+                return True
+
+            if self.synthesize(test_text, max_retries=1) is not None:
                 print(" TTS服务连接正常")
                 return True
             else:
@@ -180,4 +204,239 @@ class TTSService:
                 return False
         except Exception as e:
             print(f" 无法连接到TTS服务: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+class TTSService(TTSSynthesizer):
+    """语音合成加本机播放：逐句合成并依次播放，支持打断"""
+
+    def __init__(self, tts_url="http://127.0.0.1:9880", text_language="zh", cache_dir="tts_cache",
+                 cache_memory_bytes=32 * 1024 * 1024, cache_disk_bytes=256 * 1024 * 1024,
+                 prebuffer_ms=200, transport=None, max_pending_sentences=32):
+        """初始化TTS服务
+
+        合成相关参数见TTSSynthesizer；
+        prebuffer_ms为边下载边播放时开始出声前需要缓冲的音频时长；
+        max_pending_sentences为播报队列中最多等待合成的句子数
+        """
+        super().__init__(tts_url, text_language, cache_dir, cache_memory_bytes, cache_disk_bytes, transport)
+        self.prebuffer_ms = prebuffer_ms
+
+        # 初始化音频输出（直接按WAV自身的采样率播放内存中的音频）
+        self.player = AudioPlayer()
+        try:
+            sd.query_devices(kind="output")
+            print(" 音频输出系统初始化完成")
+        except Exception as e:
+            print(f" 音频输出系统初始化失败: {e}")
+            self.tts_enabled = False
+
+        # 有未播完的语音时为True，变化时调用speaking_callback(is_speaking)
+        self.speaking_callback = None
+
+        # 所有语音都经由同一个调度器合成和播放
+        self.scheduler = PlaybackScheduler(self, max_pending=max_pending_sentences)
+
+    def text_to_speech(self, text):
+        """播报一段文本并等待播放结束，返回是否完整播放"""
+        if not self.tts_enabled or not text:
+            return False
+
+        turn = self.create_pipeline()
+        segmenter = SentenceSegmenter()
+        for sentence in segmenter.feed(text) + segmenter.flush():
+            turn.speak(sentence)
+        turn.close()
+        return turn.wait()
+
+    def create_pipeline(self, trace=None):
+        """开始一次逐句播报，返回可追加句子的SpeechTurn，用于边生成边播报；trace为本轮的延迟追踪"""
+        return self.scheduler.begin_turn(trace)
+
+    def cancel(self):
+        """打断播报：停止当前播放，丢弃待合成的句子并中止进行中的TTS请求"""
+        self.scheduler.cancel()
+
+    def play_audio_stream(self, chunks, on_start=None):
+        """边接收WAV字节块边播放，播放完成后返回；on_start在开始出声时调用"""
+        try:
+            print(" 播放音频中...")
+            if self.player.play_stream(chunks, prebuffer_ms=self.prebuffer_ms, on_start=on_start):
+                print(" 音频播放完成")
+                return True
+            print(" 音频播放未完成")
+            return False
+        except Exception as e:
+            print(f" 播放音频失败: {e}")
+            return False
+
+
+class SpeechTurn:
+    """一次回复的语音播报句柄，属于创建时的播报代次，代次被取消后不再播放"""
+
+    def __init__(self, scheduler, turn_id, generation, trace=None):
+        self.scheduler = scheduler
+        self.turn_id = turn_id
+        self.generation = generation
+        self.completed = False
+        self._done = Event()
+        # 播报结束前本轮追踪不写出
+        self.trace = trace
+        if trace:
+            trace.hold()
+
+    def mark(self, event, last=False):
+        """在本轮追踪中记录事件"""
+        if self.trace:
+            self.trace.mark(event, last)
+
+    @property
+    def cancelled(self):
+        return self.generation != self.scheduler.generation
+
+    def speak(self, sentence):
+        """追加一句待播报的文本"""
+        if sentence:
+            self.mark("first_sentence")
+            self.scheduler.enqueue(self, sentence)
+
+    def close(self):
+        """标记文本结束"""
+        self.scheduler.enqueue(self, None)
+
+    def wait(self, timeout=None):
+        """等待本次播报结束，返回是否完整播放"""
+        self._done.wait(timeout)
+        return self.completed
+
+    def finish(self, completed):
+        if not self._done.is_set():
+            self.completed = completed
+            self._done.set()
+            self.scheduler.forget(self)
+            if self.trace:
+                self.trace.mark("playback_end", last=True)
+                self.trace.set(tts_completed=completed)
+                self.trace.release()
+
+
+class PlaybackScheduler:
+    """全局唯一的播报调度器：一个合成线程依次下载各句音频，一个播放线程按顺序边收边播
+
+    队列有界，线程数固定；cancel()使当前代次的所有句子失效，停止播放并中止进行中的请求
+    """
+
+    def __init__(self, tts_service, max_pending=32, max_prefetch=2):
+        self.tts_service = tts_service
+        self.generation = 0
+        self._turn_ids = itertools.count(1)
+        self._open_turns = set()
+        self._active_response = None
+        self._lock = Lock()
+        self._sentences = queue.Queue(maxsize=max_pending)
+        self._clips = queue.Queue(maxsize=max_prefetch)  # 最多提前下载的句数
+        Thread(target=self._synthesize_loop, daemon=True).start()
+        Thread(target=self._play_loop, daemon=True).start()
+
+    def begin_turn(self, trace=None):
+        with self._lock:
+            turn = SpeechTurn(self, next(self._turn_ids), self.generation, trace)
+            self._open_turns.add(turn)
+            if len(self._open_turns) == 1:
+                self._notify_speaking(True)
+        return turn
+
+    def forget(self, turn):
+        with self._lock:
+            if turn not in self._open_turns:
+                return
+            self._open_turns.discard(turn)
+            if not self._open_turns:
+                self._notify_speaking(False)
+
+    def _notify_speaking(self, speaking):
+        callback = self.tts_service.speaking_callback
+        if callback:
+            callback(speaking)
+
+    def cancel(self):
+        """取消所有未播完的播报"""
+        with self._lock:
+            self.generation += 1
+            turns = list(self._open_turns)
+            response = self._active_response
+        if response is not None:
+            try:
+                response.close()
+            except Exception:
+                pass
+        self.tts_service.player.stop()
+        for turn in turns:
+            turn.finish(False)
+        if turns:
+            print(" 语音播报已打断")
+
+    def enqueue(self, turn, sentence):
+        """把句子放入待合成队列（sentence为None表示本次播报结束）；队列满时等待"""
+        if not self.tts_service.tts_enabled:
+            turn.finish(False)
+            return
+        if not self._put(self._sentences, turn, sentence):
+            turn.finish(False)
+
+    def _put(self, target, turn, item):
+        while not turn.cancelled:
+            try:
+                target.put((turn, item), timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _set_response(self, response):
+        with self._lock:
+            self._active_response = response
+
+    def _synthesize_loop(self):
+        while True:
+            turn, sentence = self._sentences.get()
+            if turn.cancelled:
+                continue
+            if sentence is None:
+                self._put(self._clips, turn, None)
+                continue
+
+            cleaned_text = self.tts_service.clean_text_for_tts(sentence, max_length=None)
+            # 只有标点的句子（如单独的"……"）不送去合成
+            if not re.search(r'[\u4e00-\u9fa5a-zA-Z0-9]', cleaned_text) or \
+                    cleaned_text == "抱歉，这段内容无法转换为语音":
+                continue
+
+            # 先把音频通道放入播放队列，播放线程可在下载过程中开始播放
+            stream = ChunkStream()
+            if not self._put(self._clips, turn, stream):
+                continue
+            try:
+                for chunk in self.tts_service.synthesize_stream(
+                        cleaned_text,
+                        is_cancelled=lambda: turn.cancelled,
+                        on_response=self._set_response):
+                    if turn.cancelled:
+                        break
+                    turn.mark("tts_first_byte")
+                    stream.write(chunk)
+                else:
+                    turn.mark("first_sentence_synthesized")
+            except Exception as e:
+                print(f" TTS处理过程中发生错误: {e}")
+            finally:
+                self._set_response(None)
+                stream.close()
+
+    def _play_loop(self):
+        while True:
+            turn, stream = self._clips.get()
+            if stream is None:
+                turn.finish(not turn.cancelled)
+            elif not turn.cancelled:
+                self.tts_service.play_audio_stream(stream, on_start=lambda: turn.mark("playback_start"))
@@ -0,0 +1,103 @@
+"""
+对话轮次调度模块
+回复进行中也可以继续录音提问：新问题按策略排队、打断当前回复或与待处理的问题合并，
+由单独的线程依次处理，已识别出的问题不会被丢弃
+"""
+from collections import deque
+from threading import Thread, Condition
+
+POLICIES = ("queue", "interrupt", "merge")
+
+
+class TurnScheduler:
+    def __init__(self, handler, cancel=None, policy="queue", max_pending=3):
+        """初始化调度器
+
+        handler(text, trace): 处理一轮对话，阻塞到回复结束；trace为该轮的延迟追踪（可能为None）
+        cancel(): 中止正在进行的回复（interrupt策略使用）
+        policy: queue - 依次回答；interrupt - 打断当前回复，只回答最新的问题；
+                merge - 回复期间的多个问题合并成一轮回答
+        max_pending: queue策略下最多等待的轮数，超出时并入最后一轮而不是丢弃
+        busy_callback(busy): 提交后开始有待处理的轮次、以及全部处理完时调用（持有内部锁时调用，应尽快返回）
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"不支持的轮次策略: {policy}")
+        self.handler = handler
+        self.cancel = cancel
+        self.policy = policy
+        self.max_pending = max(1, max_pending)
+        self.busy_callback = None
+        self._pending = deque()
+        self._running = False
+        self._stopped = False
+        self._condition = Condition()
+        Thread(target=self._run, daemon=True).start()
+
+    def submit(self, text, trace=None):
+        """提交一个问题，返回处理方式："started"、"queued"、"merged"或"interrupted"
+
+        合并时沿用最新一段录音的追踪，延迟从用户最后一次说完开始计算
+        """
+        with self._condition:
+            idle = not self._running and not self._pending
+            if self.policy == "interrupt":
+                self._pending.clear()
+                self._pending.append((text, trace))
+                status = "interrupted" if self._running else "started"
+                if self._running and self.cancel:
+                    self.cancel()
+            elif self._running and self._pending and (
+                    self.policy == "merge" or len(self._pending) >= self.max_pending):
+                pending_text, pending_trace = self._pending[-1]
+                self._pending[-1] = (f"{pending_text}\n{text}", trace or pending_trace)
+                status = "merged"
+            else:
+                self._pending.append((text, trace))
+                status = "started" if idle else "queued"
+            if idle:
+                self._notify_busy(True)
+            self._condition.notify()
+            return status
+
+    @property
+    def busy(self):
+        """是否有正在进行或等待的回复"""
+        return self._running or bool(self._pending)
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    def stop(self):
+        with self._condition:
+            if self._pending and not self._running:
+                self._notify_busy(False)
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify()
+
+    def _notify_busy(self, busy):
+        if self.busy_callback:
+            try:
+                self.busy_callback(busy)
+            except Exception as e:
+                print(f" 状态通知出错: {e}")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                text, trace = self._pending.popleft()
+                self._running = True
+            try:
+                self.handler(text, trace)
+            except Exception as e:
+                print(f"\n 处理错误: {e}")
+            finally:
+                with self._condition:
+                    self._running = False
+                    if not self._pending:
+                        self._notify_busy(False)
@@ -0,0 +1,58 @@
+"""
+对话状态模块
+各环节（录音、识别、生成、播报、模型加载）在开始和结束时上报，状态机按优先级得出当前状态，
+只在状态变化时通知订阅者，界面不再定时轮询各线程的标志位
+"""
+from threading import RLock
+
+IDLE = "idle"
+LOADING = "loading"
+RECORDING = "recording"
+TRANSCRIBING = "transcribing"
+GENERATING = "generating"
+SPEAKING = "speaking"
+
+STATE_NAMES = {
+    IDLE: "空闲",
+    LOADING: "加载中",
+    RECORDING: "录音中",
+    TRANSCRIBING: "识别中",
+    GENERATING: "生成回复中",
+    SPEAKING: "播报中",
+}
+
+# 多个环节同时进行时（如回复期间录下一个问题），显示优先级最高的一个
+PRIORITY = (RECORDING, GENERATING, TRANSCRIBING, SPEAKING, LOADING)
+
+
+class TurnStateMachine:
+    def __init__(self):
+        self.state = IDLE
+        self._active = set()
+        self._listeners = []
+        self._lock = RLock()
+
+    def subscribe(self, listener):
+        """注册listener(old_state, new_state)，在触发变化的线程中调用，应尽快返回"""
+        self._listeners.append(listener)
+
+    def set_active(self, activity, active):
+        """上报某个环节开始（active=True）或结束"""
+        with self._lock:
+            if active:
+                self._active.add(activity)
+            else:
+                self._active.discard(activity)
+            new_state = next((a for a in PRIORITY if a in self._active), IDLE)
+            if new_state == self.state:
+                return
+            old_state, self.state = self.state, new_state
+            # 在锁内通知，保证订阅者按发生顺序收到变化
+            for listener in self._listeners:
+                try:
+                    listener(old_state, new_state)
+                except Exception as e:
+                    print(f" 状态通知出错: {e}")
+
+    def is_active(self, activity):
+        return activity in self._active
@@ -0,0 +1,133 @@
+"""
+语音活动检测模块
+基于短时能量与过零率的向量化VAD，带自适应噪声基底
+"""
+import numpy as np
+
+
+class VoiceActivityDetector:
+    def __init__(self, sample_rate=16000, frame_ms=30, energy_ratio=3.0, max_zcr=0.25,
+                 min_noise_floor=1e-3, max_noise_floor=1e-2, noise_adapt_rate=0.05, min_speech_frames=3):
+        """初始化VAD
+
+        energy_ratio: 帧能量超过噪声基底的倍数才可能判为语音
+        max_zcr: 过零率高于该值且能量不够大的帧视为噪声（如嘶嘶声）
+        max_noise_floor: 背景噪声RMS能量的上限，更高的“基底”说明估计时用到的是语音而不是静音
+        min_speech_frames: 连续多少帧语音才算一段有效语音
+        """
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.energy_ratio = energy_ratio
+        self.max_zcr = max_zcr
+        self.min_noise_floor = min_noise_floor
+        self.max_noise_floor = max_noise_floor
+        self.noise_adapt_rate = noise_adapt_rate
+        self.min_speech_frames = min_speech_frames
+        self.reset()
+
+    def reset(self):
+        """重置流式检测状态"""
+        self.noise_floor = None
+        self.start_segment()
+
+    def start_segment(self):
+        """开始新的一段检测，保留已估计的噪声基底（持续监听时使用）"""
+        self.speech_detected = False  # 是否已出现过有效语音
+        self.trailing_silence = 0.0  # 最近一段连续静音的时长（秒）
+        self.elapsed = 0.0  # 已处理音频时长（秒）
+        self._speech_run = 0
+        self._residual = np.zeros(0, dtype=np.float32)
+
+    @property
+    def frame_duration(self):
+        return self.frame_length / self.sample_rate
+
+    def _to_float(self, samples):
+        samples = np.asarray(samples).reshape(-1)
+        if samples.dtype == np.int16:
+            return samples.astype(np.float32) / 32768.0
+        return samples.astype(np.float32, copy=False)
+
+    def frame_features(self, samples):
+        """按帧计算RMS能量与过零率，不足一帧的尾部被丢弃"""
+        n_frames = len(samples) // self.frame_length
+        frames = samples[:n_frames * self.frame_length].reshape(n_frames, self.frame_length)
+        energy = np.sqrt(np.mean(frames * frames, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        return energy, zcr
+
+    def _classify(self, energy, zcr, noise_floor):
+        """根据噪声基底判断每一帧是否为语音"""
+        threshold = noise_floor * self.energy_ratio
+        loud = energy > threshold
+        # 高过零率的低能量帧多为噪声；能量足够大时（如清辅音）仍保留
+        return loud & ((zcr < self.max_zcr) | (energy > threshold * 2))
+
+    def detect(self, samples, noise_floor=None):
+        """离线检测整段音频，返回每帧的语音标记
+
+        noise_floor为在真正的静音上测得的噪声基底（如录音时流式检测的noise_floor）；
+        未提供时以低分位能量估计，估计值明显高于背景噪声时说明整段都是语音，全部标为语音
+        """
+        samples = self._to_float(samples)
+        energy, zcr = self.frame_features(samples)
+        if len(energy) == 0:
+            return np.zeros(0, dtype=bool)
+        if noise_floor is None:
+            noise_floor = float(np.percentile(energy, 10))
+            if noise_floor > self.max_noise_floor:
+                # 没有静音可供估计：以语音为基底会把边缘较轻的语音当成静音
+                return np.ones(len(energy), dtype=bool)
+        noise_floor = min(max(noise_floor, self.min_noise_floor), self.max_noise_floor)
+        return self._classify(energy, zcr, noise_floor)
+
+    def trim(self, samples, padding_ms=200, noise_floor=None):
+        """定位语音起止位置，返回(start, end)采样下标；没有语音时返回(0, 0)
+
+        noise_floor的含义见detect
+        """
+        speech = self.detect(samples, noise_floor)
+        k = self.min_speech_frames
+        if len(speech) < k:
+            return 0, 0
+
+        # 只承认连续k帧以上的语音，过滤瞬时噪声
+        runs = np.convolve(speech.astype(np.int32), np.ones(k, dtype=np.int32), mode="valid") >= k
+        hits = np.flatnonzero(runs)
+        if len(hits) == 0:
+            return 0, 0
+
+        padding = int(self.sample_rate * padding_ms / 1000)
+        start = max(0, hits[0] * self.frame_length - padding)
+        end = min(len(samples), (hits[-1] + k) * self.frame_length + padding)
+        return int(start), int(end)
+
+    def process(self, samples):
+        """流式处理一块音频（录音回调中调用），更新语音/静音状态，返回每帧的语音标记"""
+        samples = np.concatenate([self._residual, self._to_float(samples)])
+        energy, zcr = self.frame_features(samples)
+        self._residual = samples[len(energy) * self.frame_length:]
+        if len(energy) == 0:
+            return np.zeros(0, dtype=bool)
+
+        if self.noise_floor is None:
+            self.noise_floor = max(float(np.min(energy)), self.min_noise_floor)
+
+        speech = self._classify(energy, zcr, self.noise_floor)
+        for frame_energy, is_speech in zip(energy, speech):
+            if is_speech:
+                self._speech_run += 1
+                if self._speech_run >= self.min_speech_frames:
+                    self.speech_detected = True
+                    self.trailing_silence = 0.0
+            else:
+                self._speech_run = 0
+                self.trailing_silence += self.frame_duration
+                # 仅在静音帧上更新噪声基底，跟随环境噪声缓慢变化
+                self.noise_floor = max(
+                    (1 - self.noise_adapt_rate) * self.noise_floor + self.noise_adapt_rate * float(frame_energy),
+                    self.min_noise_floor
+                )
+        self.elapsed += len(energy) * self.frame_duration
+        return speech
@@ -1,66 +1,200 @@
-import keyboard
-import time
-from threading import Thread, Lock
+import queue
+from threading import Thread
 from speech_recognizer import SpeechRecognizer
 from tts_service import TTSService
 from ai_client import AIClient
+from recognition_worker import RecognitionWorker
+from response_cache import ResponseCache
+from turn_scheduler import TurnScheduler
+from token_coalescer import TokenCoalescer
+from hotkeys import HotkeyListener
+import latency_trace
+from turn_state import TurnStateMachine, STATE_NAMES, LOADING, RECORDING, TRANSCRIBING, GENERATING, SPEAKING
+import config
 
 
 class VoiceChatSystem:
-    def __init__(self, enable_tts=True):
-        """初始化语音聊天系统"""
-        self.speech_recognizer = SpeechRecognizer("base")
-        self.tts_service = TTSService() if enable_tts else None
-        self.ai_client = AIClient()
-        self.is_processing = False
-        self.current_response = ""
+    def __init__(self, enable_tts=True, auto_endpoint=config.ASR_AUTO_ENDPOINT):
+        """初始化语音聊天系统
+
+        auto_endpoint为True时按一下空格开始录音，说完后自动结束；
+        state为对话状态机，GUI和命令行订阅其状态变化
+        """
+        if config.TRACE_ENABLED:
+            latency_trace.configure(config.TRACE_FILE, max_bytes=config.TRACE_MAX_BYTES,
+                                    backup_count=config.TRACE_BACKUP_COUNT)
+        self.state = TurnStateMachine()
+        self.state.set_active(LOADING, True)
+        self.speech_recognizer = SpeechRecognizer(
+            config.ASR_MODEL_SIZE,
+            backend=config.ASR_BACKEND,
+            device=config.ASR_DEVICE,
+            compute_type=config.ASR_COMPUTE_TYPE,
+            streaming=config.ASR_STREAMING,
+            auto_endpoint=auto_endpoint
+        )
+        self.speech_recognizer.recording_callback = lambda active: self.state.set_active(RECORDING, active)
+        # GUI模式下识别在独立线程中进行，结果通过回调返回
+        self.recognition_worker = RecognitionWorker(self.speech_recognizer)
+        self.recognition_worker.busy_callback = lambda active: self.state.set_active(TRANSCRIBING, active)
+        # 唤醒词模式：持续监听，检测到唤醒词后识别指令
+        self.wake_listener = None
+        if config.LISTEN_MODE == "wake_word":
+            from wake_word import WakeWordListener
+            self.wake_listener = WakeWordListener(
+                config.WAKE_WORDS,
+                backend=config.ASR_BACKEND,
+                model_size=config.WAKE_WORD_MODEL_SIZE,
+                device=config.ASR_DEVICE,
+                compute_type=config.ASR_COMPUTE_TYPE,
+                threshold=config.WAKE_WORD_THRESHOLD
+            )
+            # 按键录音、正在回复或正在播报时暂停监听，避免把自己的语音当成唤醒词；
+            # 播报在回复生成结束后仍会持续一段时间，需单独判断
+            self.wake_listener.is_suspended = (
+                lambda: (self.speech_recognizer.recording_status or self.is_processing or
+                         self.state.is_active(SPEAKING))
+            )
+            self.wake_listener.on_utterance = self.recognition_worker.submit
+        self.tts_service = TTSService(
+            config.TTS_URL,
+            cache_dir=config.TTS_CACHE_DIR,
+            cache_memory_bytes=config.TTS_CACHE_MEMORY_BYTES,
+            cache_disk_bytes=config.TTS_CACHE_DISK_BYTES,
+            prebuffer_ms=config.TTS_PREBUFFER_MS,
+            max_pending_sentences=config.TTS_MAX_PENDING_SENTENCES
+        ) if enable_tts else None
+        if self.tts_service:
+            self.tts_service.speaking_callback = lambda active: self.state.set_active(SPEAKING, active)
+        if self.wake_listener:
+            # 唤醒与按键录音一样，按轮次策略决定是否打断当前回复
+            self.wake_listener.on_wake = self._on_user_speech
+        response_cache = ResponseCache(
+            max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl=config.RESPONSE_CACHE_TTL,
+            fuzzy_threshold=config.RESPONSE_CACHE_FUZZY_THRESHOLD
+        ) if config.RESPONSE_CACHE_ENABLED else None
+        self.ai_client = AIClient(
+            config.OLLAMA_URL,
+            config.OLLAMA_MODEL,
+            context_tokens=config.OLLAMA_CONTEXT_TOKENS,
+            system_prompt=config.OLLAMA_SYSTEM_PROMPT,
+            summary_model=config.OLLAMA_SUMMARY_MODEL,
+            keep_alive=config.OLLAMA_KEEP_ALIVE,
+            options={"num_ctx": config.OLLAMA_NUM_CTX, "num_predict": config.OLLAMA_NUM_PREDICT},
+            response_cache=response_cache,
+            cache_context_messages=config.RESPONSE_CACHE_CONTEXT_MESSAGES
+        )
+        if config.LLM_SPECULATIVE_PREFILL and config.ASR_STREAMING:
+            # 录音期间每当识别文本稳定增长，就用它预热Ollama的提示缓存
+            self.speech_recognizer.partial_callback = self.ai_client.prefill
         self.enable_tts = enable_tts
-        self.processing_lock = Lock()
         self.response_callback = None  # 响应回调函数
+        # 同一显示帧内到达的token合并成一次回调
+        self.token_coalescer = TokenCoalescer(self._emit_response, interval=config.GUI_FRAME_INTERVAL_MS / 1000)
+        # 回复进行中识别出的新问题按策略排队、打断或合并，不会丢弃
+        self.turn_scheduler = TurnScheduler(
+            self._respond,
+            cancel=self.cancel_response,
+            policy=config.TURN_POLICY,
+            max_pending=config.TURN_MAX_PENDING
+        )
+        # 问题提交时即进入生成状态（识别状态在提交之后才结束），排队的各轮之间也不回到空闲
+        self.turn_scheduler.busy_callback = lambda active: self.state.set_active(GENERATING, active)
+
+    @property
+    def is_processing(self):
+        """是否有正在进行或等待中的回复"""
+        return self.turn_scheduler.busy
+
+    def start_recording(self):
+        """开始录音；interrupt策略下用户开口即打断当前回复"""
+        self._on_user_speech()
+        self.ai_client.cancel_prefill()
+        self.speech_recognizer.start_recording()
+
+    def _on_user_speech(self):
+        """用户开始提新问题：interrupt策略下整轮放弃当前回复（生成与播报一起停止），
+        queue/merge策略下当前回复照常生成并播报完"""
+        if config.TURN_POLICY == "interrupt":
+            self.cancel_response()
+
+    def cancel_response(self):
+        """放弃当前回复：停止Ollama生成和语音播报"""
+        self.ai_client.cancel()
+        if self.tts_service:
+            self.tts_service.cancel()
 
     def set_response_callback(self, callback):
         """设置响应回调函数"""
         self.response_callback = callback
 
+    def _emit_response(self, text):
+        if self.response_callback:
+            self.response_callback(text, done=False)
+
     def stream_response_callback(self, content, done=False):
-        """流式回复回调函数"""
+        """流式回复回调函数：token按显示帧合并后交给GUI回调"""
         if done:
+            # 先发出尚未发出的内容，再通知结束
+            self.token_coalescer.flush()
             print(f"\n{'=' * 60}")
-            self.current_response = ""
             print(" 可以继续提问（按住空格键录音）")
 
             # 调用GUI回调
             if self.response_callback:
                 self.response_callback("", done=True)
         else:
-            self.current_response += content
-            # 调用GUI回调
-            if self.response_callback:
-                self.response_callback(content, done=False)
+            self.token_coalescer.push(content)
+
+    def process_ai_response(self, user_text, trace=None):
+        """把问题交给轮次调度器，在后台线程中依次回复；返回处理方式（见TurnScheduler.submit）"""
+        # 最终识别结果延续了推测预填的文本时保留预填请求，否则取消
+        self.ai_client.resolve_prefill(user_text)
+        status = self.turn_scheduler.submit(user_text, trace)
+        if status == "queued":
+            print(f"  已排队，将在当前回复结束后回答（等待 {self.turn_scheduler.pending_count} 个）")
+        elif status == "merged":
+            print("  已与等待中的问题合并")
+        elif status == "interrupted":
+            print("  打断当前回复，回答新的问题")
+        return status
 
-    def process_ai_response(self, user_text):
-        """在单独线程中处理AI回复"""
+    def _respond(self, user_text, trace=None):
+        """处理一轮对话（在轮次调度线程中调用），生成状态由轮次调度器的busy_callback维护"""
+        self.ai_client.get_ai_response_stream(
+            user_text,
+            response_callback=self.stream_response_callback,
+            enable_tts=self.enable_tts,
+            tts_service=self.tts_service,
+            trace=trace
+        )
+
+    def initialize_async(self, callback=None):
+        """在后台加载识别模型并检查服务连接，完成后调用callback(success, message)"""
+
+        def initialize():
+            services_ok = []
+            checker = Thread(target=lambda: services_ok.append(self.check_services_connection()), daemon=True)
+            checker.start()
 
-        def get_response():
             try:
-                self.ai_client.get_ai_response_stream(
-                    user_text,
-                    response_callback=self.stream_response_callback,
-                    enable_tts=self.enable_tts,
-                    tts_service=self.tts_service
-                )
+                self.speech_recognizer.load_model()
             except Exception as e:
-                print(f"\n 处理错误: {e}")
-            finally:
-                with self.processing_lock:
-                    self.is_processing = False
-
-        with self.processing_lock:
-            if not self.is_processing:
-                self.is_processing = True
-                Thread(target=get_response, daemon=True).start()
-            else:
-                print("  正在处理上一个请求，请稍候...")
+                print(f" 语音识别模型加载失败: {e}")
+                if callback:
+                    callback(False, "语音识别模型加载失败")
+                return
+            self.state.set_active(LOADING, False)
+
+            checker.join()
+            if callback:
+                if services_ok and services_ok[0]:
+                    callback(True, "")
+                else:
+                    callback(False, "服务连接失败")
+
+        Thread(target=initialize, daemon=True).start()
 
     def check_services_connection(self):
         """检查所有服务连接"""
@@ -68,6 +202,7 @@ class VoiceChatSystem:
         if not self.ai_client.check_connection():
             print(" 请先启动Ollama服务: ollama serve")
             return False
+        self.ai_client.preload()
 
         # 检查TTS服务
         if self.enable_tts and self.tts_service:
@@ -76,6 +211,7 @@ class VoiceChatSystem:
                 self.enable_tts = False
             else:
                 print(" 语音输出功能已启用")
+                self.tts_service.prewarm()
 
         return True
 
@@ -89,6 +225,10 @@ class VoiceChatSystem:
         if not self.check_services_connection():
             return
 
+        # 加载识别模型
+        self.speech_recognizer.load_model()
+        self.state.set_active(LOADING, False)
+
         print("\n  使用说明:")
         print("  • 按住空格键开始录音")
         print("  • 松开空格键停止录音并识别")
@@ -97,33 +237,56 @@ class VoiceChatSystem:
         print("=" * 60)
         print(" 可以开始对话了...")
 
+        # 热键与说话结束检测都以事件形式送入队列，主循环阻塞等待，空闲时不再定时唤醒
+        events = queue.Queue()
+        hotkeys = HotkeyListener(config.HOTKEYS, debounce_ms=config.HOTKEY_DEBOUNCE_MS)
+        hotkeys.on_press = lambda action: events.put(("press", action))
+        hotkeys.on_release = lambda action: events.put(("release", action))
+        self.speech_recognizer.endpoint_callback = lambda: events.put(("endpoint", None))
+        hotkeys.start()
+        self.state.subscribe(lambda old, new: print(f" [{STATE_NAMES[new]}]"))
+
         try:
             while True:
-                # 检测空格键按下
-                if (keyboard.is_pressed('space') and
-                        not self.speech_recognizer.recording_status and
-                        not self.is_processing):
-                    self.speech_recognizer.start_recording()
-
-                # 检测空格键释放
-                if (not keyboard.is_pressed('space') and
-                        self.speech_recognizer.recording_status):
-                    user_text = self.speech_recognizer.stop_recording_and_recognize()
-                    if user_text and len(user_text.strip()) > 0:
-                        print(f"\n 您的提问: {user_text}")
-                        print("-" * 40)
-                        self.process_ai_response(user_text)
-                    elif user_text == "":
-                        print(" 没有识别到内容，请重新说话")
-
-                # 检测ESC键退出
-                if keyboard.is_pressed('esc'):
+                kind, action = events.get()
+
+                # 回复进行中也可以录音，新问题由轮次调度器处理
+                if kind == "press" and action == "talk":
+                    if not self.speech_recognizer.recording_status:
+                        self.start_recording()
+                    continue
+
+                if kind == "press" and action == "exit":
                     print("\n 退出程序")
+                    self.turn_scheduler.stop()
+                    self.cancel_response()
                     break
 
-                time.sleep(0.05)  # 降低CPU使用率
+                # 松开录音键停止录音（免按住模式下改为检测说话结束）
+                if self.speech_recognizer.auto_endpoint:
+                    should_stop = kind == "endpoint"
+                else:
+                    should_stop = kind == "release" and action == "talk"
+                if should_stop and self.speech_recognizer.recording_status:
+                    utterance = self.speech_recognizer.stop_recording()
+                    if utterance is None:
+                        continue
+                    self.state.set_active(TRANSCRIBING, True)
+                    try:
+                        user_text = self.speech_recognizer.recognize(utterance)
+                        if user_text and len(user_text.strip()) > 0:
+                            print(f"\n 您的提问: {user_text}")
+                            print("-" * 40)
+                            self.process_ai_response(user_text, utterance.trace)
+                        elif user_text == "":
+                            print(" 没有识别到内容，请重新说话")
+                    finally:
+                        # 问题已交给轮次调度器（进入生成状态）后再结束识别状态
+                        self.state.set_active(TRANSCRIBING, False)
 
         except KeyboardInterrupt:
             print("\n\n 程序被用户中断")
         except Exception as e:
-            print(f"\n程序错误: {e}")
\ No newline at end of file
+            print(f"\n程序错误: {e}")
+        finally:
+            hotkeys.stop()
@@ -0,0 +1,236 @@
+"""
+唤醒词监听模块
+持续监听麦克风：VAD常驻运行，只有出现语音时才用小模型检测唤醒词，
+检测到唤醒词后把整段语音（含预录部分）交给完整识别
+"""
+import re
+import queue
+import logging
+import difflib
+import numpy as np
+import sounddevice as sd
+from threading import Thread, Event
+from audio_buffer import AudioBuffer, RingBuffer
+from vad import VoiceActivityDetector
+from asr_backends import create_backend
+from speech_recognizer import Utterance
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text):
+    """去掉标点与空白，便于比较"""
+    return re.sub(r'[^\w]', '', text or "").lower()
+
+
+class KeywordSpotter:
+    def __init__(self, wake_words, backend="whisper", model_size="tiny", device=None,
+                 compute_type="int8", threshold=0.75, max_lead=2):
+        """用小模型识别短语音片段，再与唤醒词做模糊匹配
+
+        唤醒词必须出现在开头，之前最多允许max_lead个字的语气词（如“嗯”“那个”）
+        """
+        self.wake_words = [normalize_text(word) for word in wake_words]
+        self.max_lead = max_lead
+        self.prompt = "，".join(wake_words)  # 用唤醒词作为提示，提高识别命中率
+        self.threshold = threshold
+        self.backend_name = backend
+        self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
+        self.backend = None
+
+    def load_model(self):
+        if self.backend is None:
+            self.backend = create_backend(self.backend_name, self.model_size, device=self.device,
+                                          compute_type=self.compute_type)
+
+    def match(self, text):
+        """在文本开头查找唤醒词，返回唤醒词结束位置（规范化文本中的下标），未找到返回-1"""
+        text = normalize_text(text)
+        best_end, best_score = -1, 0.0
+        for word in self.wake_words:
+            # 在与唤醒词等长的滑动窗口上比较相似度，容忍同音字等识别误差；
+            # 窗口起点限制在开头的max_lead个字以内，句子中间提到唤醒词不算
+            for start in range(min(max(1, len(text) - len(word) + 1), self.max_lead + 1)):
+                window = text[start:start + len(word)]
+                score = difflib.SequenceMatcher(None, window, word).ratio()
+                if score > best_score:
+                    best_end, best_score = start + len(window), score
+        return best_end if best_score >= self.threshold else -1
+
+    def spot(self, audio):
+        """识别音频片段并检测唤醒词，返回(是否唤醒, 唤醒词之后的文本)"""
+        result = self.backend.transcribe(audio, initial_prompt=self.prompt)
+        end = self.match(result["text"])
+        if end < 0:
+            return False, ""
+        return True, normalize_text(result["text"])[end:]
+
+    def strip_wake_word(self, text):
+        """去掉识别文本开头的唤醒词（及其后的标点）"""
+        if not text:
+            return text
+        normalized_end = self.match(text)
+        if normalized_end < 0:
+            return text
+        # 将规范化文本中的位置映射回原文本
+        count = 0
+        for index, char in enumerate(text):
+            if re.match(r'\w', char):
+                count += 1
+                if count == normalized_end:
+                    return re.sub(r'^[\W_]+', '', text[index + 1:])
+        return text
+
+
+class WakeWordListener:
+    IDLE = "idle"  # 静音，只运行VAD
+    SPEECH = "speech"  # 出现语音，等待唤醒词检测
+    IGNORE = "ignore"  # 未检测到唤醒词，忽略本段语音直到静音
+    ACTIVE = "active"  # 已唤醒，收集指令直到说话结束
+
+    def __init__(self, wake_words, sample_rate=16000, pre_roll=0.5, spot_window=2.0,
+                 endpoint_silence=0.8, follow_up_timeout=5.0, max_utterance=30.0, **spotter_options):
+        """初始化唤醒词监听
+
+        pre_roll: 语音起点之前保留的预录时长（秒），避免吞掉开头
+        spot_window: 用于唤醒词检测的语音长度（秒）
+        follow_up_timeout: 只说了唤醒词时，等待后续指令的时长（秒）
+        """
+        self.sample_rate = sample_rate
+        self.blocksize = int(sample_rate * 0.1)  # 100ms一块，减少回调唤醒次数
+        self.spot_window = spot_window
+        self.endpoint_silence = endpoint_silence
+        self.follow_up_timeout = follow_up_timeout
+        self.max_utterance = max_utterance
+        self.spotter = KeywordSpotter(wake_words, **spotter_options)
+        self.vad = VoiceActivityDetector(sample_rate)
+        self.pre_roll = RingBuffer(int(sample_rate * pre_roll))
+        self.segment = AudioBuffer(sample_rate)
+
+        self.on_utterance = None  # 唤醒后的完整语音回调 on_utterance(Utterance)
+        self.on_wake = None  # 检测到唤醒词时的回调
+        self.is_suspended = None  # 返回True时暂停监听（如按键录音或播放回复时）
+
+        self.state = self.IDLE
+        self._segment_has_wake_word = False  # 当前语音段是否以唤醒词开头（唤醒后的追加指令不含唤醒词）
+        self._follow_up_until = 0.0
+        self._clock = 0.0  # 已处理音频总时长（秒），用作监听线程内的时钟
+        self._blocks = queue.Queue()
+        self._stop_event = Event()
+        self._stream = None
+        self._thread = None
+
+    def start(self):
+        """加载唤醒词模型并开始持续监听"""
+        self.spotter.load_model()
+        self._stop_event.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        def audio_callback(indata, frames, time, status):
+            if status:
+                logger.warning(f"监听音频流状态: {status}")
+            self._blocks.put(indata.copy())
+
+        self._stream = sd.InputStream(
+            samplerate=self.sample_rate,
+            channels=1,
+            callback=audio_callback,
+            blocksize=self.blocksize,
+            dtype=np.int16
+        )
+        self._stream.start()
+        logger.info("唤醒词监听已启动")
+
+    def stop(self):
+        """停止监听"""
+        self._stop_event.set()
+        try:
+            if self._stream:
+                self._stream.stop()
+                self._stream.close()
+        except Exception as e:
+            logger.error(f"停止监听流时出错: {e}")
+        self._blocks.put(None)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            block = self._blocks.get()
+            if block is None:
+                break
+            try:
+                self._process_block(block)
+            except Exception as e:
+                logger.error(f"唤醒词监听出错: {e}")
+                self._reset()
+
+    def _reset(self):
+        self.state = self.IDLE
+        self.segment.clear()
+        self.vad.start_segment()
+
+    def _process_block(self, block):
+        self._clock += len(block) / self.sample_rate
+        if self.is_suspended and self.is_suspended():
+            if self.state != self.IDLE:
+                self._reset()
+            self.pre_roll.clear()
+            return
+
+        self.vad.process(block)
+
+        if self.state == self.IDLE:
+            self.pre_roll.write(block)
+            if not self.vad.speech_detected:
+                return
+            # 语音开始：从预录部分开始收集本段语音
+            self.segment.clear()
+            self.segment.append(self.pre_roll.read_all())
+            self.pre_roll.clear()
+            if self._clock < self._follow_up_until:
+                logger.info("收到唤醒后的指令")
+                self.state = self.ACTIVE
+                self._segment_has_wake_word = False
+            else:
+                self.state = self.SPEECH
+            return
+
+        self.segment.append(block)
+        ended = self.vad.trailing_silence >= self.endpoint_silence
+
+        if self.state == self.SPEECH:
+            if self.segment.duration >= self.spot_window or ended:
+                audio = self.segment.get_float32(0, int(self.sample_rate * self.spot_window))
+                woken, remainder = self.spotter.spot(audio)
+                if not woken:
+                    self.state = self.IGNORE
+                else:
+                    logger.info("检测到唤醒词")
+                    self.state = self.ACTIVE
+                    self._segment_has_wake_word = True
+                    if self.on_wake:
+                        self.on_wake()
+                    if ended and not remainder:
+                        # 只说了唤醒词：等待下一段语音作为指令
+                        self._follow_up_until = self._clock + self.follow_up_timeout
+                        self._reset()
+                        return
+
+        if self.state == self.IGNORE:
+            if self.segment.duration >= self.max_utterance:
+                # 持续"语音"多半是环境噪声变大，重新估计噪声基底
+                self.vad.noise_floor = None
+                self._reset()
+            elif ended:
+                self._reset()
+            return
+
+        if self.state == self.ACTIVE and (ended or self.segment.duration >= self.max_utterance):
+            self._follow_up_until = 0.0
+            utterance = Utterance(self.segment.get_float32(), self.sample_rate,
+                                  wake_word=self._segment_has_wake_word, noise_floor=self.vad.noise_floor)
+            self._reset()
+            if self.on_utterance:
+                self.on_utterance(utterance)